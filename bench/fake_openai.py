@@ -0,0 +1,103 @@
+# 本機假的 OpenAI chat completions server，給壓測用（不需要網路、不花錢）
+#
+#   FAKE_LATENCY_MS=800 FAKE_JITTER_MS=200 FAKE_ERROR_RATE=0.05 uvicorn bench.fake_openai:app --port 9000
+#   FAKE_STREAM_ABORT_RATE=0.1 FAKE_STREAM_ABORT_AFTER=3 ...   # 串流送了 3 個 chunk 後斷線（測中途改送 backup）
+#   OPENAI_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=fake uvicorn main:app
+import os
+import json
+import time
+import random
+import hashlib
+import asyncio
+from typing import Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake OpenAI")
+
+LATENCY_MS = float(os.getenv("FAKE_LATENCY_MS", "500"))
+JITTER_MS = float(os.getenv("FAKE_JITTER_MS", "0"))  # 延遲在 ±JITTER_MS 內均勻抖動
+ERROR_RATE = float(os.getenv("FAKE_ERROR_RATE", "0"))  # 這個比例的請求直接回 500
+SEED = os.getenv("FAKE_SEED", "0")
+# stream=true 時：先睡 FAKE_FIRST_TOKEN_MS，之後每個 chunk 間隔 FAKE_CHUNK_MS
+FIRST_TOKEN_MS = float(os.getenv("FAKE_FIRST_TOKEN_MS", "200"))
+CHUNK_MS = float(os.getenv("FAKE_CHUNK_MS", "10"))
+CHUNK_CHARS = 8
+# 這個比例的串流在送出 FAKE_STREAM_ABORT_AFTER 個 chunk 之後直接斷線（沒有 finish_reason、沒有 [DONE]）
+STREAM_ABORT_RATE = float(os.getenv("FAKE_STREAM_ABORT_RATE", "0"))
+STREAM_ABORT_AFTER = int(os.getenv("FAKE_STREAM_ABORT_AFTER", "3"))
+
+FAKE_TEXT = (
+    "今天整體大概 70 分（0–100）。\n"
+    "A. 今天整體表現總結\n- 蛋白質有，蔬菜偏少。\n"
+    "B. 今天吃得不錯的地方\n- 早餐有蛋。\n"
+    "C. 今天可以改進的地方\n- 手搖飲改無糖。\n"
+    "D. 明天可以怎麼做更好\n- 7-11：茶葉蛋＋無糖豆漿＋沙拉。"
+)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    raw = await request.body()
+    body = json.loads(raw)
+    # 每個請求的結果（失敗、斷線、抖動）由 seed＋請求內容決定，不受併發下請求到達的順序影響
+    rng = random.Random(f"{SEED}:{hashlib.sha256(raw).hexdigest()}")
+    if ERROR_RATE and rng.random() < ERROR_RATE:
+        await asyncio.sleep(jittered(rng, LATENCY_MS) / 2000)
+        return JSONResponse(
+            status_code=500,
+            content={"error": {"message": "fake upstream error", "type": "server_error", "code": None}},
+        )
+    if body.get("stream"):
+        abort_after = STREAM_ABORT_AFTER if STREAM_ABORT_RATE and rng.random() < STREAM_ABORT_RATE else None
+        first_token_ms = jittered(rng, FIRST_TOKEN_MS)
+        return StreamingResponse(
+            stream_chunks(body.get("model", "fake"), first_token_ms, abort_after), media_type="text/event-stream"
+        )
+
+    await asyncio.sleep(jittered(rng, LATENCY_MS) / 1000)
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": FAKE_TEXT},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 300, "completion_tokens": 120, "total_tokens": 420},
+    }
+
+
+def jittered(rng: random.Random, ms: float) -> float:
+    return max(0.0, ms + rng.uniform(-JITTER_MS, JITTER_MS))
+
+
+async def stream_chunks(model: str, first_token_ms: float, abort_after: Optional[int] = None):
+    await asyncio.sleep(first_token_ms / 1000)
+    for n, i in enumerate(range(0, len(FAKE_TEXT), CHUNK_CHARS)):
+        if n == abort_after:
+            # 回應已經開始送了，丟例外會讓 uvicorn 直接把連線切掉
+            raise ConnectionAbortedError("fake mid-stream abort")
+        chunk = {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {"content": FAKE_TEXT[i:i + CHUNK_CHARS]}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        await asyncio.sleep(CHUNK_MS / 1000)
+    done = {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+    }
+    yield f"data: {json.dumps(done)}\n\n"
+    yield "data: [DONE]\n\n"
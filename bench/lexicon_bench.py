@@ -0,0 +1,71 @@
+# 食物詞庫比對的 micro-benchmark：Aho-Corasick vs 舊的 any(k in text) 逐字掃
+#
+#   python bench/lexicon_bench.py --terms 100,1000,5000,20000 --log-chars 50,500,5000
+#
+# 詞是隨機產生的中文字串（2–5 字），長紀錄是隨機字元中間插入真的詞，
+# 所以比對數量大致跟紀錄長度成正比。
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from food_lexicon import FoodLexicon, FoodTerm, CATEGORIES  # noqa: E402
+
+CJK = [chr(c) for c in range(0x4E00, 0x4E00 + 3000)]
+
+
+def make_terms(n: int, rng: random.Random) -> list:
+    terms = set()
+    while len(terms) < n:
+        terms.add("".join(rng.choice(CJK) for _ in range(rng.randint(2, 5))))
+    return [FoodTerm(t, rng.choice(CATEGORIES), 100.0, 5.0) for t in sorted(terms)]
+
+
+def make_text(chars: int, terms: list, rng: random.Random) -> str:
+    out = []
+    while sum(len(x) for x in out) < chars:
+        out.append(rng.choice(terms).term if rng.random() < 0.2 else rng.choice(CJK))
+    return "".join(out)[:chars]
+
+
+def naive(text: str, terms: list) -> int:
+    return sum(1 for t in terms if t.term in text)
+
+
+def timeit(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--terms", default="100,1000,5000,20000")
+    parser.add_argument("--log-chars", default="50,500,5000")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'terms':>7} {'build_ms':>9} {'chars':>6} {'ac_us':>10} {'naive_us':>10} {'speedup':>8} {'matches':>8}")
+    for n in (int(x) for x in args.terms.split(",")):
+        terms = make_terms(n, rng)
+        t0 = time.perf_counter()
+        lexicon = FoodLexicon(terms)
+        build_ms = (time.perf_counter() - t0) * 1000
+        for chars in (int(x) for x in args.log_chars.split(",")):
+            text = make_text(chars, terms, rng)
+            ac = timeit(lambda: lexicon.find(text), args.repeat)
+            nv = timeit(lambda: naive(text, terms), args.repeat)
+            matches = len(lexicon.find(text))
+            print(f"{n:>7} {build_ms:>9.1f} {chars:>6} {ac * 1e6:>10.0f} {nv * 1e6:>10.0f} {nv / ac:>7.1f}x {matches:>8}")
+
+
+if __name__ == "__main__":
+    main()
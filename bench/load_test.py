@@ -0,0 +1,329 @@
+# 壓測 harness：起一個假的 completion server + 真的 main.py，用不同大小的 payload、逐步加大併發
+#
+#   python bench/load_test.py --levels 1,2,4,8,16 --requests 64 --latency-ms 500
+#   python bench/load_test.py --sizes small,large --endpoint stream --error-rate 0.05 --json --out run.json
+#   python bench/load_test.py --endpoint stream --stream-abort-rate 0.2    # 上游中途斷線 → 後端改送 backup
+#   python bench/load_test.py --json --out new.json --compare old.json    # 跟上一次（例如上一個 commit）比
+#
+# 全部在本機跑，不需要網路；--seed 固定的話 payload 每次都一樣。
+# 預設關掉 response cache（ANALYZE_CACHE_SIZE=0），量的是真的打上游的路徑；要量 cache 加 --with-cache。
+# circuit breaker 預設也不會跳（整輪共用一個後端，跳開一次後面全部變 backup，結果就沒辦法重現）；
+# 要量 breaker 的行為加 --breaker，每一輪的 opened / fallback 原因會記在結果的 "breaker" 裡。
+# 上游每次固定睡 latency-ms，所以如果後端沒有卡住 event loop，
+# 吞吐量應該約等於 min(併發, OPENAI_MAX_CONCURRENCY) / latency。
+import os
+import sys
+import json
+import time
+import socket
+import random
+import asyncio
+import argparse
+import platform
+import subprocess
+from typing import List, Optional
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAYLOAD = {
+    "context": {"goal_type": "fat_loss"},
+    "food_logs": [
+        {"date": "2026-01-01", "meal_type": "早餐", "description": "茶葉蛋、無糖豆漿"},
+        {"date": "2026-01-01", "meal_type": "午餐", "description": "雞腿便當、青菜"},
+        {"date": "2026-01-01", "meal_type": "點心", "description": "珍奶半糖"},
+    ],
+    "user_profile": {"age": 30, "gender": "男", "country": "Taiwan"},
+}
+
+# (天數, 每天最少餐數, 每天最多餐數, 每餐最多幾樣)
+SIZES = {
+    "small": (1, 1, 3, 2),
+    "medium": (1, 3, 5, 4),
+    "large": (7, 3, 5, 5),  # 跟 App 一樣送最近 7 天
+    "huge": (7, 6, 10, 12),  # 會超過 PROMPT_LOG_TOKEN_BUDGET，走裁切
+}
+MEAL_TYPES = ["早餐", "午餐", "晚餐", "點心", "宵夜"]
+GOAL_TYPES = ["muscle_gain", "fat_loss", "maintenance"]
+COUNTRIES = ["Taiwan", "台灣", "Japan", "Korea", "USA", None]
+FILLERS = ["一份", "大碗", "加蛋", "少油", "外帶", "半碗", "一杯"]
+
+
+def load_food_terms() -> List[str]:
+    with open(os.path.join(ROOT, "food_lexicon.json"), encoding="utf-8") as f:
+        return [x["term"] for x in json.load(f)["terms"] if x["category"] != "neutral"]
+
+
+def make_payload(size: str, rng: random.Random, terms: List[str]) -> dict:
+    days, min_meals, max_meals, max_items = SIZES[size]
+    logs = []
+    for d in range(days):
+        date = f"2026-01-{d + 1:02d}"
+        for _ in range(rng.randint(min_meals, max_meals)):
+            items = [rng.choice(terms) + (rng.choice(FILLERS) if rng.random() < 0.3 else "")
+                     for _ in range(rng.randint(1, max_items))]
+            logs.append({"date": date, "meal_type": rng.choice(MEAL_TYPES), "description": "、".join(items)})
+    profile = {
+        "age": rng.randint(18, 65),
+        "gender": rng.choice(["男", "女"]),
+        "height_cm": rng.randint(150, 190),
+        "weight_kg": rng.randint(45, 100),
+        "country": rng.choice(COUNTRIES),
+    }
+    return {"context": {"goal_type": rng.choice(GOAL_TYPES)}, "food_logs": logs, "user_profile": profile}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app: str, port: int, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app, "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+        env={**os.environ, **env},
+    )
+
+
+async def wait_ready(url: str, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError(f"server not ready: {url}")
+
+
+def percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    # nearest-rank
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+async def post_json(client: httpx.AsyncClient, url: str, payload: dict) -> dict:
+    resp = await client.post(url, json=payload)
+    resp.raise_for_status()
+    return {"is_backup": resp.json().get("is_backup")}
+
+
+async def post_stream(client: httpx.AsyncClient, url: str, payload: dict) -> dict:
+    # 讀完整個 SSE，從 done 事件拿 server 端量的 ttfb 和 is_backup
+    done = {}
+    async with client.stream("POST", url, json=payload) as resp:
+        resp.raise_for_status()
+        event = None
+        async for line in resp.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: ") and event == "done":
+                done = json.loads(line[6:])
+    return {"is_backup": done.get("is_backup"), "ttfb_ms": done.get("ttfb_ms")}
+
+
+async def run_level(
+    base_url: str, endpoint: str, payloads: List[dict], concurrency: int, total: int
+) -> dict:
+    url = f"{base_url}/analyze-day/stream" if endpoint == "stream" else f"{base_url}/analyze-day"
+    send = post_stream if endpoint == "stream" else post_json
+    latencies: List[float] = []
+    ttfbs: List[float] = []
+    backups = 0
+    errors = 0
+    next_index = 0
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal backups, errors, next_index
+        while next_index < total:
+            payload = payloads[next_index % len(payloads)]
+            next_index += 1
+            t0 = time.perf_counter()
+            try:
+                result = await send(client, url, payload)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+            if result.get("is_backup"):
+                backups += 1
+            if result.get("ttfb_ms") is not None:
+                ttfbs.append(result["ttfb_ms"])
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+
+    latencies.sort()
+    ttfbs.sort()
+    ok = len(latencies)
+
+    def ms(v: Optional[float]) -> Optional[float]:
+        return round(v * 1000, 1) if v is not None else None
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "rps": round(ok / elapsed, 2),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "backup_rate": round(backups / ok, 4) if ok else None,
+        "ttfb_p50_ms": percentile(ttfbs, 50),
+        "ttfb_p95_ms": percentile(ttfbs, 95),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def breaker_stats(base_url: str) -> dict:
+    async with httpx.AsyncClient(timeout=10) as client:
+        resp = await client.get(f"{base_url}/breaker/stats")
+        resp.raise_for_status()
+        return resp.json()
+
+
+def breaker_delta(before: dict, after: dict) -> dict:
+    # /breaker/stats 是累計值，只留這一輪的增量
+    fallbacks = {}
+    for reason, n in after["fallbacks"].items():
+        n -= before["fallbacks"].get(reason, 0)
+        if n:
+            fallbacks[reason] = n
+    return {
+        "state": after["state"],
+        "opened": after["opened"] - before["opened"],
+        "rejected": after["rejected"] - before["rejected"],
+        "fallbacks": fallbacks,
+    }
+
+
+def print_table(results: List[dict]) -> None:
+    print(
+        f"{'endpoint':>8} {'size':>6} {'conc':>5} {'rps':>8} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} "
+        f"{'backup':>7} {'err':>4} {'opened':>6}"
+    )
+    for r in results:
+        print(
+            f"{r['endpoint']:>8} {r['size']:>6} {r['concurrency']:>5} {r['rps']:>8.2f} "
+            f"{r['p50_ms'] or 0:>8.0f} {r['p95_ms'] or 0:>8.0f} {r['p99_ms'] or 0:>8.0f} "
+            f"{r['backup_rate'] or 0:>7.1%} {r['errors']:>4} {r.get('breaker', {}).get('opened', 0):>6}"
+        )
+
+
+def print_compare(old: dict, results: List[dict], file=sys.stdout) -> None:
+    before = {(r["endpoint"], r["size"], r["concurrency"]): r for r in old.get("results", [])}
+    print(f"\ncompared with {old.get('meta', {}).get('commit') or 'previous run'}:", file=file)
+    print(f"{'endpoint':>8} {'size':>6} {'conc':>5} {'rps':>16} {'p95_ms':>16}", file=file)
+    for r in results:
+        b = before.get((r["endpoint"], r["size"], r["concurrency"]))
+        if b is None:
+            continue
+        rps = f"{b['rps']:.1f}->{r['rps']:.1f}"
+        p95 = f"{b['p95_ms'] or 0:.0f}->{r['p95_ms'] or 0:.0f}"
+        print(f"{r['endpoint']:>8} {r['size']:>6} {r['concurrency']:>5} {rps:>16} {p95:>16}", file=file)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--levels", default="1,2,4,8,16")
+    parser.add_argument("--requests", type=int, default=64, help="每個 (size, 併發) 送幾個請求")
+    parser.add_argument("--sizes", default="small,large", help=",".join(SIZES))
+    parser.add_argument("--endpoint", choices=["json", "stream"], default="json")
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--first-token-ms", type=float, default=200)
+    parser.add_argument("--stream-abort-rate", type=float, default=0, help="上游串流中途斷線的比例")
+    parser.add_argument("--stream-abort-after", type=int, default=3, help="斷線前先送幾個 chunk")
+    parser.add_argument("--max-concurrency", type=int, default=16)
+    parser.add_argument("--with-cache", action="store_true")
+    parser.add_argument("--breaker", action="store_true", help="用預設的 circuit breaker 設定（預設讓它不會跳）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="結果以 JSON 印到 stdout")
+    parser.add_argument("--out", help="結果 JSON 另存到這個檔案")
+    parser.add_argument("--compare", help="跟之前存下來的結果 JSON 比較")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    terms = load_food_terms()
+    sizes = args.sizes.split(",")
+    levels = [int(x) for x in args.levels.split(",")]
+    payloads = {size: [make_payload(size, rng, terms) for _ in range(args.requests)] for size in sizes}
+
+    fake_port, app_port = free_port(), free_port()
+    fake = start_server("bench.fake_openai:app", fake_port, {
+        "FAKE_LATENCY_MS": str(args.latency_ms),
+        "FAKE_JITTER_MS": str(args.jitter_ms),
+        "FAKE_ERROR_RATE": str(args.error_rate),
+        "FAKE_FIRST_TOKEN_MS": str(args.first_token_ms),
+        "FAKE_STREAM_ABORT_RATE": str(args.stream_abort_rate),
+        "FAKE_STREAM_ABORT_AFTER": str(args.stream_abort_after),
+        "FAKE_SEED": str(args.seed),
+    })
+    backend = start_server("main:app", app_port, {
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "OPENAI_MAX_CONCURRENCY": str(args.max_concurrency),
+        "OPENAI_MAX_RETRIES": "0",
+        "ANALYZE_CACHE_SIZE": "1024" if args.with_cache else "0",
+        "ANALYZE_CACHE_DB": "",
+        "DAY_STORE_DB": "",
+        **({} if args.breaker else {"BREAKER_MIN_CALLS": "1000000000"}),
+    })
+    base_url = f"http://127.0.0.1:{app_port}"
+    results = []
+    try:
+        await wait_ready(f"http://127.0.0.1:{fake_port}/docs")
+        await wait_ready(f"{base_url}/health")
+        for size in sizes:
+            for level in levels:
+                before = await breaker_stats(base_url)
+                r = await run_level(base_url, args.endpoint, payloads[size], level, args.requests)
+                r["breaker"] = breaker_delta(before, await breaker_stats(base_url))
+                results.append({"endpoint": args.endpoint, "size": size, **r})
+    finally:
+        backend.terminate()
+        fake.terminate()
+        backend.wait()
+        fake.wait()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": int(time.time()),
+            "python": platform.python_version(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        print_table(results)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            # --json 時 stdout 只留 JSON，比較表改印到 stderr
+            print_compare(json.load(f), results, file=sys.stderr if args.json else sys.stdout)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,105 @@
+# 冷啟動 benchmark：從起 process 到 /health、/ready、第一個 /analyze-day 回來各花多久
+#
+#   python bench/startup_bench.py --runs 5
+#   python bench/startup_bench.py --runs 5 --json --max-first-response-ms 3000   # CI 用，超過就 exit 1
+#
+# 上游是本機假的 completion server，所以量到的是我們自己的啟動成本。
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+import httpx
+
+from load_test import PAYLOAD, free_port, start_server, wait_ready
+
+
+async def poll(client: httpx.AsyncClient, url: str, deadline: float) -> float:
+    while time.perf_counter() < deadline:
+        try:
+            if (await client.get(url)).status_code == 200:
+                return time.perf_counter()
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.005)
+    raise RuntimeError(f"timed out waiting for {url}")
+
+
+async def one_run(fake_port: int, fast_start: bool, timeout: float) -> dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    t0 = time.perf_counter()
+    proc = start_server("main:app", port, {
+        "OPENAI_API_KEY": "fake",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{fake_port}/v1",
+        "FAST_START": "1" if fast_start else "0",
+        # 每次都用新的 cache，不然第二次之後量到的是 cache hit
+        "ANALYZE_CACHE_DB": "",
+        "DAY_STORE_DB": "",
+    })
+    try:
+        deadline = t0 + timeout
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            # /ready 從一開始就在旁邊輪詢，量的是它真正變 200 的時間，不受第一個請求影響
+            ready_task = asyncio.create_task(poll(client, f"{base_url}/ready", deadline))
+            try:
+                t_health = await poll(client, f"{base_url}/health", deadline)
+                resp = await client.post(f"{base_url}/analyze-day", json=PAYLOAD)
+                t_first = time.perf_counter()
+                t_ready = await ready_task
+            finally:
+                ready_task.cancel()
+        return {
+            "health_ms": (t_health - t0) * 1000,
+            "ready_ms": (t_ready - t0) * 1000,
+            "first_response_ms": (t_first - t0) * 1000,
+            "first_is_backup": resp.json().get("is_backup"),
+        }
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+async def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=100)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--max-first-response-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    fake_port = free_port()
+    fake = start_server("bench.fake_openai:app", fake_port, {"FAKE_LATENCY_MS": str(args.latency_ms)})
+    report = {}
+    try:
+        await wait_ready(f"http://127.0.0.1:{fake_port}/docs")
+        for fast_start in (False, True):
+            runs = [await one_run(fake_port, fast_start, args.timeout) for _ in range(args.runs)]
+            report["fast_start" if fast_start else "default"] = {
+                key: round(statistics.median(r[key] for r in runs), 1)
+                for key in ("health_ms", "ready_ms", "first_response_ms")
+            } | {"backup_runs": sum(1 for r in runs if r["first_is_backup"])}
+    finally:
+        fake.terminate()
+        fake.wait()
+
+    if args.json:
+        print(json.dumps(report))
+    else:
+        print(f"{'mode':>11} {'health_ms':>10} {'ready_ms':>9} {'first_ms':>9} {'backup':>7}")
+        for mode, r in report.items():
+            print(f"{mode:>11} {r['health_ms']:>10.0f} {r['ready_ms']:>9.0f} {r['first_response_ms']:>9.0f} {r['backup_runs']:>7}")
+
+    if args.max_first_response_ms:
+        worst = max(r["first_response_ms"] for r in report.values())
+        if worst > args.max_first_response_ms:
+            print(f"first response {worst:.0f} ms > {args.max_first_response_ms:.0f} ms", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
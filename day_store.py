@@ -0,0 +1,124 @@
+# 伺服器端的每日飲食紀錄（SQLite），依 (user_id, date) 存
+# 每筆紀錄新增時就把詞庫比對結果一起存起來，分析時不用重掃；
+# 也會記住上一次的分析結果，只新增餐點時可以只把差異送給 AI
+import json
+import time
+import sqlite3
+import threading
+from typing import List, NamedTuple, Optional
+
+from food_lexicon import MealStats
+
+
+class StoredLog(NamedTuple):
+    id: int
+    date: str
+    time: Optional[str]
+    meal_type: str
+    description: str
+    stats: MealStats
+
+
+class StoredAnalysis(NamedTuple):
+    log_ids: List[int]
+    context_key: str  # 目標＋個人資料的 hash，變了就不能沿用
+    score: int
+    analysis_text: str
+
+
+class DayStore:
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS food_logs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    time TEXT,
+                    meal_type TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    stats TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS ix_food_logs_user_date ON food_logs (user_id, date, id);
+                CREATE TABLE IF NOT EXISTS day_analysis (
+                    user_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    log_ids TEXT NOT NULL,
+                    context_key TEXT NOT NULL,
+                    score INTEGER NOT NULL,
+                    analysis_text TEXT NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (user_id, date)
+                );
+                """
+            )
+            self._db.commit()
+
+    def append(
+        self, user_id: str, date: str, time_: Optional[str], meal_type: str, description: str, stats: MealStats
+    ) -> int:
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO food_logs (user_id, date, time, meal_type, description, stats, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (user_id, date, time_, meal_type, description, json.dumps(stats.to_dict()), time.time()),
+            )
+            self._db.commit()
+            return cur.lastrowid
+
+    def delete(self, user_id: str, date: str, log_id: int) -> bool:
+        with self._lock:
+            cur = self._db.execute(
+                "DELETE FROM food_logs WHERE user_id = ? AND date = ? AND id = ?", (user_id, date, log_id)
+            )
+            self._db.commit()
+            return cur.rowcount > 0
+
+    def list(self, user_id: str, date: str) -> List[StoredLog]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, date, time, meal_type, description, stats FROM food_logs "
+                "WHERE user_id = ? AND date = ? ORDER BY id",
+                (user_id, date),
+            ).fetchall()
+        return [
+            StoredLog(r[0], r[1], r[2], r[3], r[4], MealStats.from_dict(r[3], json.loads(r[5])))
+            for r in rows
+        ]
+
+    def get_analysis(self, user_id: str, date: str) -> Optional[StoredAnalysis]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT log_ids, context_key, score, analysis_text FROM day_analysis WHERE user_id = ? AND date = ?",
+                (user_id, date),
+            ).fetchone()
+        if row is None:
+            return None
+        return StoredAnalysis(json.loads(row[0]), row[1], row[2], row[3])
+
+    def save_analysis(self, user_id: str, date: str, analysis: StoredAnalysis) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO day_analysis "
+                "(user_id, date, log_ids, context_key, score, analysis_text, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    user_id,
+                    date,
+                    json.dumps(analysis.log_ids),
+                    analysis.context_key,
+                    analysis.score,
+                    analysis.analysis_text,
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
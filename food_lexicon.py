@@ -0,0 +1,194 @@
+# 食物詞庫：把 food_lexicon.json 編成 Aho-Corasick 自動機，每筆 FoodLog 只掃一次
+# 比對規則是 leftmost-longest、不重疊（「青菜」只算一次，不會再被「菜」算一次）
+# 英文詞要整個字才算（「pancake」不算 cake、「veggie」不算 egg），中文沒有斷詞所以不檢查
+import os
+import json
+import string
+from collections import Counter, deque
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "food_lexicon.json")
+
+# 分類：protein 蛋白質、vegetable 蔬菜、sugar 含糖飲料/甜點、staple 主食、fried 油炸、fruit 水果、
+# neutral 只是用來吃掉修飾詞（例如「無糖」），不計分
+CATEGORIES = ("protein", "vegetable", "sugar", "staple", "fried", "fruit")
+
+ASCII_WORD_CHARS = frozenset(string.ascii_letters + string.digits)
+
+
+class FoodTerm(NamedTuple):
+    term: str
+    category: str
+    kcal: float  # 一份的粗估熱量
+    protein_g: float  # 一份的粗估蛋白質
+
+
+class FoodMatch(NamedTuple):
+    start: int
+    end: int
+    food: FoodTerm
+
+
+class MealStats:
+    __slots__ = ("meal_type", "matches", "counts", "kcal", "protein_g", "fried_protein_g")
+
+    def __init__(self, meal_type: str, matches: List[FoodMatch]):
+        self.meal_type = meal_type
+        self.matches = matches
+        self.counts: Counter = Counter(m.food.category for m in matches if m.food.category != "neutral")
+        self.kcal = sum(m.food.kcal for m in matches)
+        self.protein_g = sum(m.food.protein_g for m in matches)
+        # 炸雞、排骨這類歸在 fried，但蛋白質是從它們來的
+        self.fried_protein_g = sum(m.food.protein_g for m in matches if m.food.category == "fried")
+
+    def to_dict(self) -> dict:
+        return {
+            "counts": dict(self.counts),
+            "kcal": self.kcal,
+            "protein_g": self.protein_g,
+            "fried_protein_g": self.fried_protein_g,
+        }
+
+    @classmethod
+    def from_dict(cls, meal_type: str, data: dict) -> "MealStats":
+        # 從存起來的結果還原（不保留 matches），不用再掃一次
+        stats = cls(meal_type, [])
+        stats.counts = Counter(data.get("counts", {}))
+        stats.kcal = float(data.get("kcal", 0))
+        stats.protein_g = float(data.get("protein_g", 0))
+        # 舊資料沒有 fried_protein_g：有 fried 的那餐就拿整餐的蛋白質代替
+        fallback = stats.protein_g if stats.counts.get("fried") else 0.0
+        stats.fried_protein_g = float(data.get("fried_protein_g", fallback))
+        return stats
+
+
+class DayStats:
+    __slots__ = ("meals", "counts", "kcal", "protein_g")
+
+    def __init__(self, meals: List[MealStats]):
+        self.meals = meals
+        self.counts: Counter = Counter()
+        for m in meals:
+            self.counts.update(m.counts)
+        self.kcal = sum(m.kcal for m in meals)
+        self.protein_g = sum(m.protein_g for m in meals)
+
+    def has(self, category: str) -> bool:
+        return self.counts.get(category, 0) > 0
+
+
+class FoodLexicon:
+    def __init__(self, terms: Iterable[FoodTerm]):
+        # goto 用 dict-per-state，fail/output 用平行的 list，state 0 是 root
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Optional[FoodTerm]] = [None]  # 在這個 state 結束的詞
+        self._dict_link: List[int] = [0]  # 沿 fail 鏈往下第一個有詞的 state（0 表示沒有）
+        self.size = 0
+
+        for t in terms:
+            key = t.term.strip().lower()
+            if not key:
+                continue
+            state = 0
+            for ch in key:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(None)
+                    self._dict_link.append(0)
+                state = nxt
+            if self._out[state] is None:
+                self.size += 1
+            self._out[state] = FoodTerm(key, t.category, t.kcal, t.protein_g)
+        self._build_links()
+
+    def _build_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                target = self._goto[f].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                fl = self._fail[nxt]
+                self._dict_link[nxt] = fl if self._out[fl] is not None else self._dict_link[fl]
+
+    def find(self, text: str) -> List[FoodMatch]:
+        goto, fail, out, dict_link = self._goto, self._fail, self._out, self._dict_link
+        hits: List[FoodMatch] = []
+        state = 0
+        text = text.lower()  # lower() 可能改變長度，位置都以小寫後的字串為準
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            s = state if out[state] is not None else dict_link[state]
+            while s:
+                food = out[s]
+                start = i + 1 - len(food.term)
+                if self._at_word_boundary(text, start, i + 1, food.term):
+                    hits.append(FoodMatch(start, i + 1, food))
+                s = dict_link[s]
+
+        # leftmost-longest、不重疊；owner[i] 是蓋住第 i 個字的 picked 索引（-1 表示沒有）
+        hits.sort(key=lambda m: (m.start, m.start - m.end))
+        picked: List[FoodMatch] = []
+        picked_hits = set()
+        owner = [-1] * len(text)
+        last_end = 0
+        for n, m in enumerate(hits):
+            if m.start >= last_end:
+                picked_hits.add(n)
+                owner[m.start:m.end] = [len(picked)] * (m.end - m.start)
+                picked.append(m)
+                last_end = m.end
+
+        # 例外：含糖的詞只被別的詞吃掉一半時還是要算（「牛奶茶」= 牛奶＋奶茶），
+        # 不然含糖飲料會只剩蛋白質；整個被包住（「無糖」裡的字）或已經有含糖詞的就不算。
+        # 每個 hit 只看自己蓋到的幾個字，整體還是線性
+        extra: List[FoodMatch] = []
+        extra_end = 0
+        for n, m in enumerate(hits):
+            if m.food.category != "sugar" or n in picked_hits or m.start < extra_end:
+                continue
+            first, last = owner[m.start], owner[m.end - 1]
+            if first != -1 and first == last:
+                continue
+            if any(k != -1 and picked[k].food.category == "sugar" for k in owner[m.start:m.end]):
+                continue
+            extra.append(m)
+            extra_end = m.end
+        if extra:
+            picked = sorted(picked + extra, key=lambda m: (m.start, m.end))
+        return picked
+
+    @staticmethod
+    def _at_word_boundary(text: str, start: int, end: int, term: str) -> bool:
+        # 詞頭/詞尾是英數字時，外面那個字不能也是英數字
+        if term[0] in ASCII_WORD_CHARS and start > 0 and text[start - 1] in ASCII_WORD_CHARS:
+            return False
+        if term[-1] in ASCII_WORD_CHARS and end < len(text) and text[end] in ASCII_WORD_CHARS:
+            return False
+        return True
+
+    def analyze_meal(self, meal_type: str, description: str) -> MealStats:
+        return MealStats(meal_type, self.find(description))
+
+    def analyze_day(self, logs: Iterable[Any]) -> DayStats:
+        return DayStats([self.analyze_meal(x.meal_type, x.description) for x in logs])
+
+
+def load_lexicon(path: Optional[str] = None) -> FoodLexicon:
+    with open(path or DEFAULT_LEXICON_PATH, encoding="utf-8") as f:
+        raw = json.load(f)
+    return FoodLexicon(
+        FoodTerm(x["term"], x["category"], float(x.get("kcal", 0)), float(x.get("protein_g", 0)))
+        for x in raw["terms"]
+    )
@@ -1,18 +1,335 @@
 import os
+import json
+import random
+import time
+import asyncio
+import hashlib
+import importlib
 import logging
-from typing import List, Optional, Literal, Any
-from fastapi import FastAPI
+import sqlite3
+import threading
+from collections import Counter, OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import List, Optional, Literal, Any, AsyncIterator, Awaitable, Callable, Dict, NamedTuple, Set, Tuple
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, Field
-import openai
-logger.info(f"OpenAI SDK version: {openai.__version__}")
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Gauge, Histogram, generate_latest
+from prometheus_client import Counter as MetricCounter
+from prometheus_client.core import CounterMetricFamily
+from food_lexicon import CATEGORIES, DayStats, FoodLexicon, load_lexicon
+from day_store import DayStore, StoredAnalysis, StoredLog
 
 # --------- Logging ----------
 logger = logging.getLogger("ai_diet_backend")
 logging.basicConfig(level=logging.INFO)
+# httpx 每個 request 都會打一行 INFO，共用 client 之後太吵
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+
+# --------- Metrics ----------
+# Prometheus 指標，GET /metrics 匯出；cache/breaker 這類狀態用 set_function，抓取時才去讀
+STAGE_SECONDS = Histogram(
+    "analyze_stage_seconds",
+    "Time spent in each /analyze-day stage",
+    ["stage"],  # parse / score / prompt / upstream / total
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30),
+)
+UPSTREAM_SECONDS = Histogram(
+    "llm_upstream_seconds",
+    "Upstream completion latency",
+    ["mode", "outcome"],  # mode: complete / stream；outcome: ok / error / deadline
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+LLM_TOKENS = MetricCounter(
+    "llm_tokens_total",
+    "Tokens reported by the upstream provider",
+    ["kind"],  # prompt / completion / cached
+)
+RESPONSES = MetricCounter(
+    "analyze_responses_total",
+    "Analyze responses by endpoint and whether the backup text was used",
+    ["endpoint", "backup"],
+)
+FALLBACKS = MetricCounter(
+    "analyze_fallbacks_total",
+    "Backup responses caused by an upstream problem",
+    ["reason"],
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served", ["path"])
+HTTP_SECONDS = Histogram("http_request_seconds", "HTTP request duration", ["path"])
+METRIC_PATHS = {"/analyze-day", "/analyze-day/stream", "/analyze-days", "/health", "/ready", "/metrics"}
+
+
+# 純 ASGI middleware（BaseHTTPMiddleware 會把串流回應整個包一層，比較慢）
+# 順便把開始時間放進 request.state，handler 進來時就能算出讀 body＋pydantic 驗證花多久
+class MetricsMiddleware:
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope["path"] if scope["path"] in METRIC_PATHS else "other"
+        t0 = time.perf_counter()
+        scope.setdefault("state", {})["t_start"] = t0
+        profiler = start_profiler()
+        HTTP_IN_FLIGHT.labels(path).inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            HTTP_IN_FLIGHT.labels(path).dec()
+            elapsed = time.perf_counter() - t0
+            HTTP_SECONDS.labels(path).observe(elapsed)
+            if profiler is not None:
+                stop_profiler(profiler, scope["path"], elapsed)
+
+
+# 慢請求 profiler（opt-in）：設 PROFILE_SLOW_REQUEST_S 才會開，需要另外裝 pyinstrument
+# 只抽 PROFILE_SAMPLE_RATE 比例的請求來跑，超過門檻的把 profile 印到 log
+PROFILE_SLOW_REQUEST_S = env_float("PROFILE_SLOW_REQUEST_S", 0.0)
+PROFILE_SAMPLE_RATE = env_float("PROFILE_SAMPLE_RATE", 0.01)
+try:
+    from pyinstrument import Profiler
+except ImportError:
+    Profiler = None
+if PROFILE_SLOW_REQUEST_S > 0 and Profiler is None:
+    logger.warning("PROFILE_SLOW_REQUEST_S is set but pyinstrument is not installed, profiling disabled")
+
+
+def start_profiler() -> Any:
+    if PROFILE_SLOW_REQUEST_S <= 0 or Profiler is None or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    profiler = Profiler(async_mode="enabled")
+    profiler.start()
+    return profiler
+
+
+def stop_profiler(profiler: Any, path: str, elapsed: float) -> None:
+    profiler.stop()
+    if elapsed >= PROFILE_SLOW_REQUEST_S:
+        logger.warning(f"slow request {path} took {elapsed:.2f}s\n{profiler.output_text(unicode=True)}")
+
+
+# --------- LLM client ----------
+# 整個 process 共用一個 AsyncOpenAI：連線池 keep-alive，並用 semaphore 限制同時打上游的數量
+# openai 光 import 就要幾百 ms，延到第一次建 client（或 lifespan 暖機）才載入
+class LLMClient:
+    def __init__(self, api_key: str):
+        import openai, httpx
+        logger.info(f"openai={openai.__version__}, httpx={httpx.__version__}")
+
+        self.model = os.getenv("OPENAI_MODEL", "gpt-4.1-mini")
+        self.max_concurrency = max(1, env_int("OPENAI_MAX_CONCURRENCY", 8))
+        self._sem = asyncio.Semaphore(self.max_concurrency)
+        self.in_flight = 0
+        self.queued = 0
+        # 上游回報的用量；cached_tokens 是供應商 prompt cache 命中的部分
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+
+        connect_timeout = env_float("OPENAI_CONNECT_TIMEOUT", 5.0)
+        timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=env_float("OPENAI_READ_TIMEOUT", 30.0),
+            write=connect_timeout,
+            pool=connect_timeout,
+        )
+        http_client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=env_float("OPENAI_KEEPALIVE_EXPIRY", 30.0),
+            ),
+        )
+        self._client = openai.AsyncOpenAI(
+            api_key=api_key,
+            http_client=http_client,
+            timeout=timeout,
+            max_retries=env_int("OPENAI_MAX_RETRIES", 2),
+        )
+
+    async def _acquire(self) -> None:
+        # 超過上限的請求在這裡排隊，不會一起湧向上游
+        self.queued += 1
+        try:
+            await self._sem.acquire()
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._sem.release()
+
+    async def complete(self, system_prompt: str, user_prompt: str) -> str:
+        await self._acquire()
+        try:
+            resp = await self._client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.8,
+            )
+        finally:
+            self._release()
+        self._record_usage(resp.usage)
+        return (resp.choices[0].message.content or "").strip()
+
+    async def stream(self, system_prompt: str, user_prompt: str) -> AsyncIterator[str]:
+        await self._acquire()
+        try:
+            stream = await self._client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.8,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async with stream:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        self._record_usage(chunk.usage)
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        finally:
+            self._release()
+
+    def _record_usage(self, usage: Any) -> None:
+        if usage is None:
+            return
+        self.prompt_tokens += usage.prompt_tokens or 0
+        self.completion_tokens += usage.completion_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+        self.cached_tokens += cached
+        LLM_TOKENS.labels("prompt").inc(usage.prompt_tokens or 0)
+        LLM_TOKENS.labels("completion").inc(usage.completion_tokens or 0)
+        LLM_TOKENS.labels("cached").inc(cached)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+        }
+
+    async def warm_up(self) -> None:
+        # 先把 DNS、TCP、TLS 做完，連線留在 pool 裡給第一個真的請求用；回什麼狀態碼都無所謂
+        try:
+            await self._client.with_options(max_retries=0).models.list()
+        except Exception as e:
+            logger.info(f"LLM warm-up request finished with {type(e).__name__}")
+
+    async def aclose(self) -> None:
+        await self._client.close()
+
+
+llm_client: Optional[LLMClient] = None
+
+
+def get_llm_client() -> LLMClient:
+    global llm_client
+    if llm_client is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise RuntimeError("OPENAI_API_KEY not set")
+        llm_client = LLMClient(api_key)
+    return llm_client
+
+
+ready = asyncio.Event()
+warm_up_error: Optional[str] = None  # 暖機失敗的原因，/ready 會一直回 503 帶著它
+prewarm_task: Optional[asyncio.Task] = None
+
+
+async def prewarm_upstream(client: LLMClient) -> None:
+    # 上游連線預熱：不管哪個模式都在背景跑、最多等 OPENAI_PREWARM_TIMEOUT_S 秒，
+    # 上游慢或連不到也不會擋住啟動和 /ready
+    try:
+        await asyncio.wait_for(client.warm_up(), timeout=env_float("OPENAI_PREWARM_TIMEOUT_S", 2.0))
+    except asyncio.TimeoutError:
+        logger.info("LLM warm-up request timed out")
+
+
+async def warm_up() -> None:
+    # 詞庫、prompt 模板、openai import、client 都先準備好（都是本機的事）；成功了 /ready 才回 200
+    global warm_up_error, prewarm_task
+    t0 = time.perf_counter()
+    try:
+        await asyncio.to_thread(get_food_lexicon)
+        logger.info(f"prompt templates ready: {len(get_prompt_registry())}")
+        if os.getenv("OPENAI_API_KEY"):
+            await asyncio.to_thread(importlib.import_module, "openai")
+            client = get_llm_client()
+            logger.info(f"LLM client ready: model={client.model}, max_concurrency={client.max_concurrency}")
+            if os.getenv("OPENAI_PREWARM", "1") == "1":
+                prewarm_task = asyncio.create_task(prewarm_upstream(client))
+        else:
+            logger.warning("OPENAI_API_KEY not set, /analyze-day will return backup text")
+    except Exception as e:
+        warm_up_error = f"{type(e).__name__}: {e}"
+        logger.error(f"warm-up failed: {e}")
+        return
+    ready.set()
+    logger.info(f"warm-up done in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global llm_client, warm_up_error
+    # FAST_START=1：不等暖機就開始接請求（scale-to-zero 時先讓 /health 通），暖機在背景跑；
+    # 暖機完成前進來的請求會自己 lazy 建需要的東西，只是比較慢
+    ready.clear()
+    warm_up_error = None
+    warm_task: Optional[asyncio.Task] = None
+    if os.getenv("FAST_START") == "1":
+        warm_task = asyncio.create_task(warm_up())
+    else:
+        await warm_up()
+    try:
+        yield
+    finally:
+        for task in (warm_task, prewarm_task):
+            if task is not None and not task.done():
+                task.cancel()
+        if llm_client is not None:
+            await llm_client.aclose()
+            llm_client = None
+        await response_cache.aclose()
+        if day_store is not None:
+            day_store.close()
+
 
 # --------- FastAPI ----------
-app = FastAPI(title="AI Diet Backend", version="1.0.0")
+app = FastAPI(title="AI Diet Backend", version="1.0.0", lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 # 允許跨網域（給 Flutter 打）
 app.add_middleware(
@@ -36,7 +353,8 @@ class FoodLog(BaseModel):
     date: Optional[str] = None
     time: Optional[str] = None
     meal_type: str
-    description: str
+    # 詞庫比對在 event loop 上跑，一筆描述不能無限長
+    description: str = Field(max_length=env_int("FOOD_LOG_MAX_CHARS", 2000))
 
 class UserProfile(BaseModel):
     age: Optional[int] = None
@@ -55,6 +373,10 @@ class AnalyzeDayRequest(BaseModel):
     food_logs: List[FoodLog] = Field(default_factory=list)
     user_profile: Optional[UserProfile] = None
 
+class AnalyzeDaysRequest(BaseModel):
+    items: List[AnalyzeDayRequest] = Field(default_factory=list, max_length=env_int("ANALYZE_BATCH_MAX_ITEMS", 200))
+    stream: bool = False  # True：改用 NDJSON，每完成一筆就送一行（順序不保證，看 index）
+
 # --------- Models (Response) ----------
 class AnalyzeDayResponse(BaseModel):
     success: bool = True
@@ -62,38 +384,111 @@ class AnalyzeDayResponse(BaseModel):
     analysis_text: str
     is_backup: bool = False
 
+class AnalyzeDayItemResult(BaseModel):
+    index: int
+    success: bool = True
+    score: Optional[int] = None
+    analysis_text: Optional[str] = None
+    is_backup: bool = False
+    error: Optional[str] = None
+
+class AnalyzeDaysResponse(BaseModel):
+    success: bool = True
+    results: List[AnalyzeDayItemResult]
+
+# --------- Models (Day store) ----------
+class StoredFoodLog(FoodLog):
+    id: int
+
+class DayLogsResponse(BaseModel):
+    user_id: str
+    date: str
+    logs: List[StoredFoodLog]
+
+class AnalyzeStoredDayRequest(BaseModel):
+    context: Context = Field(default_factory=Context)
+    user_profile: Optional[UserProfile] = None
+
+class AnalyzeStoredDayResponse(AnalyzeDayResponse):
+    # full：整天重送；delta：上一次分析＋新增的餐；unchanged：紀錄沒變，直接回上一次的結果
+    mode: Literal["full", "delta", "unchanged"] = "full"
+
 # --------- Helpers ----------
-def estimate_score(goal_type: str, logs: List[FoodLog]) -> int:
-    # 很簡單的估分：先能動、可 demo，之後你再換成更聰明的規則/模型
+food_lexicon: Optional[FoodLexicon] = None
+
+
+def get_food_lexicon() -> FoodLexicon:
+    # 詞庫只在第一次用到（或 lifespan 暖機）時編一次
+    global food_lexicon
+    if food_lexicon is None:
+        food_lexicon = load_lexicon(os.getenv("FOOD_LEXICON_PATH") or None)
+        logger.info(f"food lexicon loaded: {food_lexicon.size} terms")
+    return food_lexicon
+
+
+def analyze_food(logs: List[FoodLog]) -> DayStats:
+    return get_food_lexicon().analyze_day(logs)
+
+
+def estimate_score(goal_type: str, logs: List[FoodLog], stats: Optional[DayStats] = None) -> int:
     if not logs:
         return 50
+    if stats is None:
+        stats = analyze_food(logs)
 
-    text = " ".join([x.description for x in logs]).lower()
     score = 60
+    # 炸雞、排骨這類雖然歸在 fried，但同一餐裡炸物的蛋白質克數夠也算有吃到蛋白質
+    # （只看 fried，白飯、麵這些主食的蛋白質加起來不算）
+    has_protein = stats.has("protein") or any(m.fried_protein_g >= 15 for m in stats.meals)
 
-    # 有蛋白質關鍵字加分
-    protein_kw = ["雞", "牛", "豬", "魚", "蛋", "豆腐", "豆漿", "優格", "鮪魚", "牛奶"]
-    veg_kw = ["菜", "青菜", "沙拉", "花椰菜", "菠菜", "高麗菜", "番茄", "小黃瓜"]
-    sugar_kw = ["珍奶", "奶茶", "可樂", "含糖", "手搖", "多糖", "全糖", "半糖"]
-
-    if any(k in text for k in protein_kw):
+    if has_protein:
         score += 10
-    if any(k in text for k in veg_kw):
+    if stats.has("vegetable"):
         score += 10
-    if any(k in text for k in sugar_kw):
+    if stats.has("sugar"):
         score -= 10
+    if stats.has("fried"):
+        score -= 5
 
     # 目標微調
-    if goal_type == "muscle_gain" and any(k in text for k in protein_kw):
+    if goal_type == "muscle_gain" and has_protein:
         score += 5
-    if goal_type == "fat_loss" and any(k in text for k in sugar_kw):
-        score -= 5
+        if stats.protein_g >= 80:
+            score += 5
+    if goal_type == "fat_loss":
+        if stats.has("sugar"):
+            score -= 5
+        if stats.kcal > 2200:
+            score -= 5
 
     # clamp
     score = max(0, min(100, score))
     return score
 
 
+CATEGORY_TEXT = {
+    "protein": "蛋白質",
+    "vegetable": "蔬菜",
+    "sugar": "含糖",
+    "staple": "主食",
+    "fried": "油炸",
+    "fruit": "水果",
+}
+
+
+def format_counts(counts: Dict[str, int]) -> str:
+    parts = [f"{CATEGORY_TEXT[c]}×{counts[c]}" for c in CATEGORIES if counts.get(c)]
+    return "、".join(parts) if parts else "（詞庫沒有對到）"
+
+
+def format_nutrition(stats: DayStats, per_meal: bool = True) -> str:
+    out = []
+    for i, m in enumerate(stats.meals if per_meal else [], 1):
+        out.append(f"{i}. {m.meal_type}：{format_counts(m.counts)}，約 {m.kcal:.0f} kcal／蛋白質 {m.protein_g:.0f} g")
+    out.append(f"合計：{format_counts(stats.counts)}，約 {stats.kcal:.0f} kcal／蛋白質 {stats.protein_g:.0f} g")
+    return "\n".join(out)
+
+
 def goal_text(goal_type: str) -> str:
     return {
         "muscle_gain": "增肌",
@@ -102,17 +497,27 @@ def goal_text(goal_type: str) -> str:
     }.get(goal_type, "維持體態")
 
 
+GOAL_TYPES = ("muscle_gain", "fat_loss", "maintenance")
+
+HINT_TW = "請用台灣情境舉例（7-11、全家、便當店、自助餐、早餐店、手搖飲），講出『去哪裡買什麼』。"
+HINT_JP = "請用日本情境舉例（コンビニ、定食、超市熟食）。"
+HINT_KR = "請用韓國情境舉例（便利商店、湯飯、紫菜包飯）。"
+HINT_US = "請用美國情境舉例（超市熟食、salad bar、sandwich）。"
+HINT_DEFAULT = "請用一般城市情境舉例（超市、便利商店、外食）。"
+COUNTRY_HINTS = (HINT_TW, HINT_JP, HINT_KR, HINT_US, HINT_DEFAULT)
+
+
 def country_hint(profile: Optional[UserProfile]) -> str:
     c = (profile.country or "").strip().lower() if profile else ""
     if "台" in c or "taiwan" in c or c in ("tw",):
-        return "請用台灣情境舉例（7-11、全家、便當店、自助餐、早餐店、手搖飲），講出『去哪裡買什麼』。"
+        return HINT_TW
     if "japan" in c or c in ("jp",) or "日本" in c:
-        return "請用日本情境舉例（コンビニ、定食、超市熟食）。"
+        return HINT_JP
     if "korea" in c or c in ("kr",) or "韓" in c:
-        return "請用韓國情境舉例（便利商店、湯飯、紫菜包飯）。"
+        return HINT_KR
     if "usa" in c or "united states" in c or c in ("us",):
-        return "請用美國情境舉例（超市熟食、salad bar、sandwich）。"
-    return "請用一般城市情境舉例（超市、便利商店、外食）。"
+        return HINT_US
+    return HINT_DEFAULT
 
 
 def format_profile(profile: Optional[UserProfile]) -> str:
@@ -141,53 +546,38 @@ def format_logs(logs: List[FoodLog]) -> str:
         out.append(f"{i}. {dt} {x.meal_type}：{x.description}")
     return "\n".join(out)
 
-import openai, httpx
-logger.info(f"openai={openai.__version__}, httpx={httpx.__version__}")
+ANALYSIS_HEADER = "【AI 分析結果】\n\n"
 
-async def call_openai(system_prompt: str, user_prompt: str) -> str:
-    from openai import OpenAI
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY not set")
-
-    client = OpenAI(api_key=api_key)
-    resp = client.chat.completions.create(
-        model=os.getenv("OPENAI_MODEL", "gpt-4.1-mini"),
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.8,
-    )
-    return (resp.choices[0].message.content or "").strip()
+EMPTY_LOGS_TEXT = (
+    f"{ANALYSIS_HEADER}"
+    "你今天還沒有任何飲食紀錄。\n"
+    "先記錄至少 1～2 餐（餐別＋吃了什麼），我才能做個人化建議。"
+)
 
 
-# --------- Routes ----------
-@app.get("/health")
-def health():
-    return {"ok": True}
+# --------- Prompt templates ----------
+try:
+    import tiktoken
+except ImportError:  # 沒裝就用字數粗估
+    tiktoken = None
 
+_token_encoder: Any = None
 
-@app.post("/analyze-day", response_model=AnalyzeDayResponse)
-async def analyze_day(payload: AnalyzeDayRequest):
-    ctx = payload.context
-    logs = payload.food_logs
-    profile = payload.user_profile
 
-    # 沒紀錄：直接回友善文字（analysis_text 一定要有）
-    if not logs:
-        text = (
-            "【AI 分析結果】\n\n"
-            "你今天還沒有任何飲食紀錄。\n"
-            "先記錄至少 1～2 餐（餐別＋吃了什麼），我才能做個人化建議。"
-        )
-        return AnalyzeDayResponse(score=50, analysis_text=text, is_backup=True)
+def count_tokens(text: str) -> int:
+    global _token_encoder
+    if tiktoken is not None:
+        if _token_encoder is None:
+            _token_encoder = tiktoken.get_encoding("o200k_base")
+        return len(_token_encoder.encode(text))
+    # 粗估：中日韓字大約 1 字 1 token，其他大約 4 個字元 1 token
+    cjk = sum(1 for ch in text if ord(ch) >= 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
 
-    score = estimate_score(ctx.goal_type, logs)
-    gtext = goal_text(ctx.goal_type)
-    phint = country_hint(profile)
 
-    system_prompt = f"""
+# system prompt 只跟 (目標, 國家情境) 有關，啟動時全部先組好；
+# 分數、個人資料、紀錄都放 user message，這樣同一組的請求 prefix 完全一樣，供應商的 prompt cache 才吃得到
+SYSTEM_PROMPT_TEMPLATE = """
 你是一位「專屬貼身 AI 營養師」，用繁體中文、台灣口吻，講得具體、像真人教練。
 目標：{gtext}
 
@@ -198,20 +588,727 @@ C. 今天可以改進的地方
 D. 明天可以怎麼做更好（要非常具體：去哪裡買、買什麼、怎麼點）
 
 規則：
-- 先在最上面寫：今天整體大概 {score} 分（0–100）。
+- 先在最上面寫：今天整體大概 X 分（0–100），X 直接用使用者訊息裡【系統估分】的分數。
 - 不要講大道理，要給可執行的選項。
 - {phint}
 - 不要輸出 JSON、不要輸出程式碼。
 """.strip()
 
+
+class PromptRegistry:
+    def __init__(self):
+        self._system: Dict[Tuple[str, str], Tuple[str, int]] = {}
+        for g in GOAL_TYPES:
+            for h in COUNTRY_HINTS:
+                self._get(goal_text(g), h)
+
+    def _get(self, gtext: str, phint: str) -> Tuple[str, int]:
+        item = self._system.get((gtext, phint))
+        if item is None:
+            text = SYSTEM_PROMPT_TEMPLATE.format(gtext=gtext, phint=phint)
+            item = (text, count_tokens(text))
+            self._system[(gtext, phint)] = item
+        return item
+
+    def system_prompt(self, goal_type: str, profile: Optional[UserProfile]) -> Tuple[str, int]:
+        return self._get(goal_text(goal_type), country_hint(profile))
+
+    def __len__(self) -> int:
+        return len(self._system)
+
+
+prompt_registry: Optional[PromptRegistry] = None
+
+
+def get_prompt_registry() -> PromptRegistry:
+    global prompt_registry
+    if prompt_registry is None:
+        prompt_registry = PromptRegistry()
+    return prompt_registry
+
+
+class PromptInfo(NamedTuple):
+    system_tokens: int
+    user_tokens: int
+    log_tokens: int
+    trimmed: bool
+
+    @property
+    def prefix_ratio(self) -> float:
+        total = self.system_tokens + self.user_tokens
+        return self.system_tokens / total if total else 0.0
+
+
+class PromptStats:
+    def __init__(self):
+        self.requests = 0
+        self.trimmed = 0
+        self.system_tokens = 0
+        self.user_tokens = 0
+
+    def record(self, info: PromptInfo) -> None:
+        self.requests += 1
+        self.trimmed += int(info.trimmed)
+        self.system_tokens += info.system_tokens
+        self.user_tokens += info.user_tokens
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"prompt tokens: system={info.system_tokens} user={info.user_tokens} "
+                f"logs={info.log_tokens} prefix_ratio={info.prefix_ratio:.2f} trimmed={info.trimmed}"
+            )
+
+    def stats(self) -> dict:
+        total = self.system_tokens + self.user_tokens
+        return {
+            "requests": self.requests,
+            "trimmed": self.trimmed,
+            "system_tokens": self.system_tokens,
+            "user_tokens": self.user_tokens,
+            "static_prefix_ratio": round(self.system_tokens / total, 4) if total else 0.0,
+            "templates": len(prompt_registry) if prompt_registry else 0,
+            "tokenizer": "tiktoken" if tiktoken is not None else "estimate",
+        }
+
+
+prompt_stats = PromptStats()
+
+
+def fit_logs(logs: List[FoodLog], stats: DayStats, budget: int) -> Tuple[str, bool]:
+    # 紀錄太長時依序縮減（結果只跟輸入有關，同樣的紀錄永遠縮成一樣）：
+    # 1. 最後一天以前的紀錄，每天收成一行摘要
+    # 2. 最後一天的描述截到 LOG_DESC_MAX_CHARS 字
+    # 3. 從最早的摘要開始丟
+    # 4. 最後一天從最早的餐開始丟
+    text = format_logs(logs)
+    if count_tokens(text) <= budget:
+        return text, False
+
+    last_date = logs[-1].date or ""
+    older: "OrderedDict[str, List[int]]" = OrderedDict()
+    recent: List[int] = []
+    for i, x in enumerate(logs):
+        if (x.date or "") == last_date:
+            recent.append(i)
+        else:
+            older.setdefault(x.date or "（未填日期）", []).append(i)
+
+    summaries = []
+    for date, idx in older.items():
+        counts: Counter = Counter()
+        for i in idx:
+            counts.update(stats.meals[i].counts)
+        summaries.append(f"- {date}：{len(idx)} 筆，{format_counts(counts)}")
+
+    max_chars = env_int("LOG_DESC_MAX_CHARS", 40)
+    details = []
+    for n, i in enumerate(recent, 1):
+        x = logs[i]
+        dt = (x.date or "") + (" " + x.time if x.time else "")
+        desc = x.description if len(x.description) <= max_chars else x.description[:max_chars] + "…"
+        details.append(f"{n}. {dt} {x.meal_type}：{desc}")
+
+    dropped_days = 0
+    dropped_meals = 0
+
+    def render() -> str:
+        parts = []
+        if dropped_days:
+            parts.append(f"（另有 {dropped_days} 天較早的紀錄省略）")
+        if summaries:
+            parts.append("較早的紀錄（摘要）：")
+            parts.extend(summaries)
+        if dropped_meals:
+            parts.append(f"（最後一天前 {dropped_meals} 筆省略）")
+        parts.extend(details)
+        return "\n".join(parts)
+
+    text = render()
+    while count_tokens(text) > budget and summaries:
+        summaries.pop(0)
+        dropped_days += 1
+        text = render()
+    while count_tokens(text) > budget and len(details) > 1:
+        details.pop(0)
+        dropped_meals += 1
+        text = render()
+    return text, True
+
+
+def build_prompts(payload: AnalyzeDayRequest, score: int, stats: DayStats) -> Tuple[str, str, PromptInfo]:
+    system_prompt, system_tokens = get_prompt_registry().system_prompt(
+        payload.context.goal_type, payload.user_profile
+    )
+
+    budget = env_int("PROMPT_LOG_TOKEN_BUDGET", 1500)
+    logs_text, trimmed = fit_logs(payload.food_logs, stats, budget)
+    # 紀錄被縮過就只給全天總計，逐餐估算會對不上
+    nutrition = format_nutrition(stats, per_meal=not trimmed)
+
     user_prompt = f"""
+【系統估分】
+今天整體大概 {score} 分（0–100）
+
 【使用者個人資料】
-{format_profile(profile)}
+{format_profile(payload.user_profile)}
 
 【今日飲食紀錄】
-{format_logs(logs)}
+{logs_text}
+
+【系統粗估（食物詞庫，僅供參考）】
+{nutrition}
 """.strip()
 
+    info = PromptInfo(system_tokens, count_tokens(user_prompt), count_tokens(logs_text), trimmed)
+    return system_prompt, user_prompt, info
+
+
+def build_delta_prompts(
+    context: Context,
+    profile: Optional[UserProfile],
+    score: int,
+    stats: DayStats,
+    previous_text: str,
+    new_logs: List[FoodLog],
+    new_stats: DayStats,
+) -> Tuple[str, str, PromptInfo]:
+    # 只新增餐點時用：送上一次的分析＋新增的紀錄，不用整天重送
+    system_prompt, system_tokens = get_prompt_registry().system_prompt(context.goal_type, profile)
+
+    budget = env_int("PROMPT_LOG_TOKEN_BUDGET", 1500)
+    logs_text, trimmed = fit_logs(new_logs, new_stats, budget)
+    previous = previous_text.removeprefix(ANALYSIS_HEADER).strip()
+
+    user_prompt = f"""
+【系統估分】
+今天整體大概 {score} 分（0–100）
+
+【使用者個人資料】
+{format_profile(profile)}
+
+【上一次的分析】
+{previous}
+
+【之後新增的飲食紀錄】
+{logs_text}
+
+【系統粗估（食物詞庫，僅供參考，含全天）】
+{format_nutrition(stats, per_meal=False)}
+
+請把新增的紀錄納入，更新上一次的分析，照原本格式完整回覆。
+""".strip()
+
+    info = PromptInfo(system_tokens, count_tokens(user_prompt), count_tokens(logs_text), trimmed)
+    return system_prompt, user_prompt, info
+
+
+def backup_text(score: int) -> str:
+    return (
+        f"{ANALYSIS_HEADER}"
+        f"今天整體大概 {score} 分。\n\n"
+        "目前暫時無法取得雲端 AI 回覆，所以先給你『快速可用』的建議：\n"
+        "A. 今天整體表現總結\n"
+        "- 先讓每餐至少有：蛋白質＋主食＋一份蔬菜。\n\n"
+        "B. 今天吃得不錯的地方\n"
+        "- 你有記錄，這件事本身就很強。\n\n"
+        "C. 今天可以改進的地方\n"
+        "- 下一餐優先補蛋白質（茶葉蛋/雞胸/豆漿/優格）。\n"
+        "- 加一份青菜（自助餐夾兩樣青菜）。\n\n"
+        "D. 明天可以怎麼做更好\n"
+        "- 7-11/全家：烤地瓜＋茶葉蛋＋無糖豆漿\n"
+        "- 便當店：主菜選雞/魚，飯七分滿，多一份青菜\n"
+    )
+
+
+# --------- Circuit breaker ----------
+class BreakerOpenError(RuntimeError):
+    pass
+
+
+# 最近 BREAKER_WINDOW_S 秒內至少 BREAKER_MIN_CALLS 次呼叫，錯誤率或慢呼叫比例超過門檻就打開；
+# 打開期間直接走 backup，BREAKER_OPEN_S 秒後放一個探測請求（half-open），成功才關回去
+# 串流記的耗時是第一個 token 的等待時間，不是整段（生成得長不代表上游慢）
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        window: float,
+        min_calls: int,
+        error_rate: float,
+        slow_call: float,
+        slow_rate: float,
+        open_for: float,
+    ):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_for = open_for
+        self.state = self.CLOSED
+        self._calls: deque = deque()  # (時間, 成功?, 耗時)
+        self._opened_at = 0.0
+        self._probing = False
+        self.opened = 0
+        self.rejected = 0
+
+    def before_call(self) -> None:
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_for:
+                self.rejected += 1
+                raise BreakerOpenError("circuit breaker open")
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                self.rejected += 1
+                raise BreakerOpenError("circuit breaker half-open, probe in flight")
+            self._probing = True
+
+    def record(self, ok: bool, latency: float) -> None:
+        now = time.monotonic()
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+            if ok and latency < self.slow_call:
+                logger.info("circuit breaker closed")
+                self.state = self.CLOSED
+                self._calls.clear()
+            else:
+                self._open(now)
+            return
+        if self.state == self.OPEN:
+            return  # 打開前就出發的呼叫，結果不算
+
+        self._calls.append((now, ok, latency))
+        while self._calls and now - self._calls[0][0] > self.window:
+            self._calls.popleft()
+        n = len(self._calls)
+        if n < self.min_calls:
+            return
+        errors = sum(1 for _, c_ok, _ in self._calls if not c_ok)
+        slow = sum(1 for _, c_ok, lat in self._calls if c_ok and lat >= self.slow_call)
+        if errors / n >= self.error_rate or slow / n >= self.slow_rate:
+            self._open(now)
+
+    def release(self) -> None:
+        # 呼叫被取消（client 斷線等），沒有結果可記，只要把探測名額還回去
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+
+    def _open(self, now: float) -> None:
+        logger.warning("circuit breaker opened")
+        self.state = self.OPEN
+        self._opened_at = now
+        self._calls.clear()
+        self.opened += 1
+
+    def stats(self) -> dict:
+        n = len(self._calls)
+        errors = sum(1 for _, ok, _ in self._calls if not ok)
+        return {
+            "state": self.state,
+            "window_calls": n,
+            "window_error_rate": round(errors / n, 4) if n else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+breaker = CircuitBreaker(
+    window=env_float("BREAKER_WINDOW_S", 30.0),
+    min_calls=env_int("BREAKER_MIN_CALLS", 5),
+    error_rate=env_float("BREAKER_ERROR_RATE", 0.5),
+    slow_call=env_float("BREAKER_SLOW_CALL_S", 10.0),
+    slow_rate=env_float("BREAKER_SLOW_RATE", 0.5),
+    open_for=env_float("BREAKER_OPEN_S", 30.0),
+)
+
+# 走 backup 的原因：breaker_open / deadline / error
+fallback_counts: Counter = Counter()
+
+
+def fallback_reason(e: BaseException) -> str:
+    if isinstance(e, BreakerOpenError):
+        return "breaker_open"
+    if isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+        return "deadline"
+    return "error"
+
+
+async def call_openai(system_prompt: str, user_prompt: str) -> str:
+    # ANALYZE_DEADLINE_S 包含排隊＋SDK 重試，時間到就放棄、改回 backup
+    client = get_llm_client()
+    breaker.before_call()
+    t0 = time.perf_counter()
+    try:
+        text = await asyncio.wait_for(
+            client.complete(system_prompt, user_prompt),
+            timeout=env_float("ANALYZE_DEADLINE_S", 15.0),
+        )
+    except Exception as e:
+        elapsed = time.perf_counter() - t0
+        UPSTREAM_SECONDS.labels("complete", fallback_reason(e)).observe(elapsed)
+        breaker.record(False, elapsed)
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    elapsed = time.perf_counter() - t0
+    UPSTREAM_SECONDS.labels("complete", "ok").observe(elapsed)
+    breaker.record(bool(text), elapsed)
+    return text
+
+
+async def stream_openai(system_prompt: str, user_prompt: str) -> AsyncIterator[str]:
+    # 串流只限制第一個 token 的等待時間（ANALYZE_FIRST_TOKEN_DEADLINE_S），之後交給 read timeout
+    client = get_llm_client()
+    breaker.before_call()
+    t0 = time.perf_counter()
+    first_token: Optional[float] = None
+    deltas = client.stream(system_prompt, user_prompt)
+    try:
+        while True:
+            timeout = env_float("ANALYZE_FIRST_TOKEN_DEADLINE_S", 10.0) if first_token is None else None
+            try:
+                delta = await asyncio.wait_for(deltas.__anext__(), timeout=timeout)
+            except StopAsyncIteration:
+                break
+            if first_token is None:
+                first_token = time.perf_counter() - t0
+            yield delta
+    except Exception as e:
+        elapsed = time.perf_counter() - t0
+        UPSTREAM_SECONDS.labels("stream", fallback_reason(e)).observe(elapsed)
+        breaker.record(False, elapsed if first_token is None else first_token)
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    else:
+        elapsed = time.perf_counter() - t0
+        UPSTREAM_SECONDS.labels("stream", "ok").observe(elapsed)
+        breaker.record(True, elapsed if first_token is None else first_token)
+    finally:
+        await deltas.aclose()
+
+
+# --------- Response cache ----------
+def hash_key(normalized: dict) -> str:
+    raw = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def normalized_context(goal_type: str, profile: Optional[UserProfile]) -> dict:
+    data = profile.model_dump(exclude_none=True) if profile else {}
+    return {
+        "goal_type": goal_type,
+        "profile": {k: v.strip().lower() if isinstance(v, str) else v for k, v in sorted(data.items())},
+    }
+
+
+def context_key(goal_type: str, profile: Optional[UserProfile]) -> str:
+    return hash_key(normalized_context(goal_type, profile))
+
+
+def request_cache_key(payload: AnalyzeDayRequest) -> str:
+    # 只取會影響 AI 回覆的欄位：目標、個人資料、依序的日期/時間/餐別/描述
+    # （日期、時間都會進 prompt，fit_logs 也是依日期分「最後一天」和前面幾天）
+    normalized = normalized_context(payload.context.goal_type, payload.user_profile)
+    normalized["logs"] = [
+        [x.date or "", x.time or "", x.meal_type.strip(), " ".join(x.description.split())]
+        for x in payload.food_logs
+    ]
+    return hash_key(normalized)
+
+
+# 記憶體 LRU+TTL，外加可選的 SQLite 層（設 ANALYZE_CACHE_DB 才會開，重開機還在）
+# 同一個 key 同時進來的請求只會打一次上游（single-flight）；is_backup=True 的回覆一律不存
+# SQLite 讀寫都丟到 thread 跑，不卡 event loop；過期資料每 purge_every 秒才清一次
+class ResponseCache:
+
+    def __init__(self, max_size: int, ttl: float, db_path: Optional[str] = None, purge_every: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self._mem: "OrderedDict[str, Tuple[float, AnalyzeDayResponse]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Task[AnalyzeDayResponse]"] = {}
+        self._writes: Set["asyncio.Future[None]"] = set()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._last_purge = 0.0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS analyze_cache ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, response TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_analyze_cache_expires ON analyze_cache (expires_at)")
+            self._db.commit()
+
+    async def get(self, key: str) -> Optional[AnalyzeDayResponse]:
+        now = time.time()
+        item = self._mem.get(key)
+        if item is not None:
+            expires_at, resp = item
+            if expires_at > now:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return resp
+            del self._mem[key]
+            self.expirations += 1
+
+        if self._db is None:
+            return None
+        resp = await asyncio.to_thread(self._db_get, key, now)
+        if resp is not None:
+            self.disk_hits += 1
+            self._mem_put(key, resp, now)
+            return resp
+        return None
+
+    def put(self, key: str, resp: AnalyzeDayResponse) -> None:
+        if resp.is_backup or self.max_size <= 0:
+            return
+        now = time.time()
+        self._mem_put(key, resp, now)
+        if self._db is not None:
+            # 寫檔不用等，呼叫端（包括 done callback）直接回去
+            fut = asyncio.ensure_future(asyncio.to_thread(self._db_put, key, resp, now))
+            self._writes.add(fut)
+            fut.add_done_callback(self._on_write_done)
+
+    async def get_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[AnalyzeDayResponse]]
+    ) -> AnalyzeDayResponse:
+        cached = await self.get(key)
+        if cached is not None:
+            return cached
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = asyncio.ensure_future(compute())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        # shield：發起的那個 client 斷線也不要取消掉大家共用的上游呼叫
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: str, task: "asyncio.Task[AnalyzeDayResponse]") -> None:
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def _on_write_done(self, fut: "asyncio.Future[None]") -> None:
+        self._writes.discard(fut)
+        if not fut.cancelled() and fut.exception() is not None:
+            logger.error(f"analyze cache write failed: {fut.exception()}")
+
+    def _mem_put(self, key: str, resp: AnalyzeDayResponse, now: float) -> None:
+        self._mem[key] = (now + self.ttl, resp)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_size:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    def _db_get(self, key: str, now: float) -> Optional[AnalyzeDayResponse]:
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT expires_at, response FROM analyze_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if row[0] <= now:
+            self.expirations += 1
+            return None
+        return AnalyzeDayResponse.model_validate_json(row[1])
+
+    def _db_put(self, key: str, resp: AnalyzeDayResponse, now: float) -> None:
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO analyze_cache (key, expires_at, response) VALUES (?, ?, ?)",
+                (key, now + self.ttl, resp.model_dump_json()),
+            )
+            if now - self._last_purge >= self.purge_every:
+                self._db.execute("DELETE FROM analyze_cache WHERE expires_at <= ?", (now,))
+                self._last_purge = now
+            self._db.commit()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._mem),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "disk": self._db is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "inflight": len(self._inflight),
+        }
+
+    async def aclose(self) -> None:
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+        if self._db is not None:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+
+response_cache = ResponseCache(
+    max_size=env_int("ANALYZE_CACHE_SIZE", 1024),
+    ttl=env_float("ANALYZE_CACHE_TTL", 3600.0),
+    db_path=os.getenv("ANALYZE_CACHE_DB") or None,
+    purge_every=env_float("ANALYZE_CACHE_PURGE_S", 300.0),
+)
+
+
+# 狀態型的 gauge：抓 /metrics 時才讀，平常沒有額外成本
+LLM_IN_FLIGHT = Gauge("llm_in_flight", "Upstream calls currently in flight")
+LLM_IN_FLIGHT.set_function(lambda: llm_client.in_flight if llm_client else 0)
+LLM_QUEUED = Gauge("llm_queued", "Requests waiting for an upstream slot")
+LLM_QUEUED.set_function(lambda: llm_client.queued if llm_client else 0)
+BREAKER_OPEN = Gauge("llm_breaker_open", "1 if the circuit breaker is open or half-open")
+BREAKER_OPEN.set_function(lambda: 0 if breaker.state == CircuitBreaker.CLOSED else 1)
+
+
+# cache 的計數只會增加，用 counter 匯出（名稱會是 analyze_cache_hits_total 這樣），rate() 才算得對
+class CacheMetricsCollector:
+    NAMES = ("hits", "disk_hits", "misses", "coalesced", "evictions", "expirations")
+
+    def collect(self):
+        for name in self.NAMES:
+            yield CounterMetricFamily(
+                f"analyze_cache_{name}", f"Response cache {name}", value=getattr(response_cache, name)
+            )
+
+
+REGISTRY.register(CacheMetricsCollector())
+
+
+# --------- Routes ----------
+@app.get("/health")
+def health():
+    return {"ok": True}
+
+
+@app.get("/ready")
+def readiness():
+    if not ready.is_set():
+        content: Dict[str, Any] = {"ready": False}
+        if warm_up_error is not None:
+            content["error"] = warm_up_error
+        return JSONResponse(status_code=503, content=content)
+    return {"ready": True}
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return response_cache.stats()
+
+
+@app.get("/breaker/stats")
+def breaker_stats():
+    return {**breaker.stats(), "fallbacks": dict(fallback_counts)}
+
+
+@app.get("/prompt/stats")
+def prompt_stats_route():
+    out = prompt_stats.stats()
+    if llm_client is not None:
+        usage = llm_client.stats()
+        out["upstream_prompt_tokens"] = usage["prompt_tokens"]
+        out["upstream_cached_tokens"] = usage["cached_tokens"]
+        out["upstream_cached_ratio"] = (
+            round(usage["cached_tokens"] / usage["prompt_tokens"], 4) if usage["prompt_tokens"] else 0.0
+        )
+    return out
+
+
+@app.post("/analyze-day", response_model=AnalyzeDayResponse)
+async def analyze_day(payload: AnalyzeDayRequest, request: Request):
+    observe_parse(request)
+    if not payload.food_logs:
+        resp = await run_analyze_day(payload)
+    else:
+        resp = await response_cache.get_or_compute(
+            request_cache_key(payload), lambda: run_analyze_day(payload)
+        )
+    observe_total(request)
+    RESPONSES.labels("analyze-day", str(resp.is_backup).lower()).inc()
+    return resp
+
+
+def observe_parse(request: Request) -> None:
+    t_start = getattr(request.state, "t_start", None)
+    if t_start is not None:
+        STAGE_SECONDS.labels("parse").observe(time.perf_counter() - t_start)
+
+
+def observe_total(request: Request) -> None:
+    t_start = getattr(request.state, "t_start", None)
+    if t_start is not None:
+        STAGE_SECONDS.labels("total").observe(time.perf_counter() - t_start)
+
+
+class PreparedDay(NamedTuple):
+    score: int
+    system_prompt: str
+    user_prompt: str
+    prompt_info: PromptInfo
+
+
+def prepare_day(payload: AnalyzeDayRequest) -> Optional[PreparedDay]:
+    # 不用打上游的部分（估分＋組 prompt）；沒紀錄回 None
+    if not payload.food_logs:
+        return None
+    t0 = time.perf_counter()
+    stats = analyze_food(payload.food_logs)
+    score = estimate_score(payload.context.goal_type, payload.food_logs, stats)
+    t1 = time.perf_counter()
+    prepared = PreparedDay(score, *build_prompts(payload, score, stats))
+    t2 = time.perf_counter()
+    STAGE_SECONDS.labels("score").observe(t1 - t0)
+    STAGE_SECONDS.labels("prompt").observe(t2 - t1)
+    return prepared
+
+
+async def run_analyze_day(payload: AnalyzeDayRequest) -> AnalyzeDayResponse:
+    return await complete_day(prepare_day(payload))
+
+
+async def complete_day(prepared: Optional[PreparedDay]) -> AnalyzeDayResponse:
+    # 沒紀錄：直接回友善文字（analysis_text 一定要有）
+    if prepared is None:
+        return AnalyzeDayResponse(score=50, analysis_text=EMPTY_LOGS_TEXT, is_backup=True)
+
+    score, system_prompt, user_prompt, prompt_info = prepared
+    # prompt 統計只算真的送上游的（cache 命中、unchanged 都不算）
+    prompt_stats.record(prompt_info)
+    t0 = time.perf_counter()
     try:
         ai_text = await call_openai(system_prompt, user_prompt)
 
@@ -219,25 +1316,229 @@ D. 明天可以怎麼做更好（要非常具體：去哪裡買、買什麼、
         if not ai_text:
             raise RuntimeError("OpenAI returned empty content")
 
-        full_text = f"【AI 分析結果】\n\n{ai_text}"
+        full_text = f"{ANALYSIS_HEADER}{ai_text}"
         return AnalyzeDayResponse(score=score, analysis_text=full_text, is_backup=False)
 
     except Exception as e:
-        logger.error(f"OpenAI error: {e}")
-
-        backup = (
-            "【AI 分析結果】\n\n"
-            f"今天整體大概 {score} 分。\n\n"
-            "目前暫時無法取得雲端 AI 回覆，所以先給你『快速可用』的建議：\n"
-            "A. 今天整體表現總結\n"
-            "- 先讓每餐至少有：蛋白質＋主食＋一份蔬菜。\n\n"
-            "B. 今天吃得不錯的地方\n"
-            "- 你有記錄，這件事本身就很強。\n\n"
-            "C. 今天可以改進的地方\n"
-            "- 下一餐優先補蛋白質（茶葉蛋/雞胸/豆漿/優格）。\n"
-            "- 加一份青菜（自助餐夾兩樣青菜）。\n\n"
-            "D. 明天可以怎麼做更好\n"
-            "- 7-11/全家：烤地瓜＋茶葉蛋＋無糖豆漿\n"
-            "- 便當店：主菜選雞/魚，飯七分滿，多一份青菜\n"
+        reason = fallback_reason(e)
+        fallback_counts[reason] += 1
+        FALLBACKS.labels(reason).inc()
+        if reason == "error":
+            logger.error(f"OpenAI error: {e}")
+        else:
+            logger.warning(f"OpenAI fallback: {reason}")
+        return AnalyzeDayResponse(score=score, analysis_text=backup_text(score), is_backup=True)
+    finally:
+        # deadline、錯誤也要算進 upstream，不然最慢的那些剛好看不到
+        STAGE_SECONDS.labels("upstream").observe(time.perf_counter() - t0)
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# SSE 事件順序：score → token（多個，串起來就是 analysis_text）→ done
+# 如果中途上游失敗，會送 backup（整段 analysis_text，App 要用它取代已收到的 token）再送 done
+@app.post("/analyze-day/stream")
+async def analyze_day_stream(payload: AnalyzeDayRequest, request: Request):
+    observe_parse(request)
+    return StreamingResponse(
+        stream_analyze_day(payload),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def stream_analyze_day(payload: AnalyzeDayRequest) -> AsyncIterator[str]:
+    # ttfb 算的是第一段分析內容（不含一開始就送出的 score）
+    t0 = time.perf_counter()
+    ttfb: Optional[float] = None
+    is_backup = False
+    # 先查 cache：命中就不用估分、組 prompt
+    key = request_cache_key(payload) if payload.food_logs else None
+    cached = await response_cache.get(key) if key else None
+    prepared = prepare_day(payload) if cached is None else None
+    score = cached.score if cached else prepared.score if prepared else 50
+
+    yield sse_event("score", {"score": score})
+
+    if cached is not None:
+        ttfb = time.perf_counter() - t0
+        yield sse_event("token", {"text": cached.analysis_text})
+    elif prepared is None:
+        is_backup = True
+        ttfb = time.perf_counter() - t0
+        yield sse_event("token", {"text": EMPTY_LOGS_TEXT})
+    else:
+        system_prompt, user_prompt = prepared.system_prompt, prepared.user_prompt
+        prompt_stats.record(prepared.prompt_info)
+        parts: List[str] = []
+        try:
+            yield sse_event("token", {"text": ANALYSIS_HEADER})
+            async for delta in stream_openai(system_prompt, user_prompt):
+                if ttfb is None:
+                    ttfb = time.perf_counter() - t0
+                parts.append(delta)
+                yield sse_event("token", {"text": delta})
+            ai_text = "".join(parts).strip()
+            if not ai_text:
+                raise RuntimeError("OpenAI returned empty content")
+            response_cache.put(key, AnalyzeDayResponse(
+                score=score, analysis_text=f"{ANALYSIS_HEADER}{ai_text}", is_backup=False
+            ))
+        except Exception as e:
+            reason = fallback_reason(e)
+            fallback_counts[reason] += 1
+            FALLBACKS.labels(reason).inc()
+            if reason == "error":
+                logger.error(f"OpenAI stream error: {e}")
+            else:
+                logger.warning(f"OpenAI stream fallback: {reason}")
+            is_backup = True
+            yield sse_event("backup", {"analysis_text": backup_text(score)})
+
+    total = time.perf_counter() - t0
+    ttfb_ms = round(ttfb * 1000, 1) if ttfb is not None else None
+    total_ms = round(total * 1000, 1)
+    logger.info(f"analyze-day/stream: ttfb_ms={ttfb_ms} total_ms={total_ms} is_backup={is_backup}")
+    RESPONSES.labels("analyze-day/stream", str(is_backup).lower()).inc()
+    yield sse_event("done", {
+        "score": score,
+        "is_backup": is_backup,
+        "ttfb_ms": ttfb_ms,
+        "total_ms": total_ms,
+    })
+
+
+# 批次：整批先估分＋組 prompt，再用 ANALYZE_BATCH_CONCURRENCY 限制同時幾筆打上游
+# 單筆失敗只會讓那一筆 success=False，不影響整批
+@app.post("/analyze-days", response_model=AnalyzeDaysResponse)
+async def analyze_days(payload: AnalyzeDaysRequest, request: Request):
+    observe_parse(request)
+    prepared: List[Any] = []
+    for item in payload.items:
+        try:
+            prepared.append(prepare_day(item))
+        except Exception as e:
+            prepared.append(e)
+
+    sem = asyncio.Semaphore(max(1, env_int("ANALYZE_BATCH_CONCURRENCY", 4)))
+
+    async def run_item(index: int) -> AnalyzeDayItemResult:
+        p = prepared[index]
+        if isinstance(p, Exception):
+            return AnalyzeDayItemResult(index=index, success=False, is_backup=True, error=str(p))
+        async with sem:
+            try:
+                if p is None:
+                    resp = await complete_day(None)
+                else:
+                    resp = await response_cache.get_or_compute(
+                        request_cache_key(payload.items[index]), lambda: complete_day(p)
+                    )
+            except Exception as e:
+                logger.error(f"analyze-days item {index} error: {e}")
+                return AnalyzeDayItemResult(index=index, success=False, is_backup=True, error=str(e))
+        RESPONSES.labels("analyze-days", str(resp.is_backup).lower()).inc()
+        return AnalyzeDayItemResult(
+            index=index, score=resp.score, analysis_text=resp.analysis_text, is_backup=resp.is_backup
+        )
+
+    if payload.stream:
+        async def ndjson() -> AsyncIterator[str]:
+            tasks = [asyncio.ensure_future(run_item(i)) for i in range(len(prepared))]
+            try:
+                for fut in asyncio.as_completed(tasks):
+                    result = await fut
+                    yield result.model_dump_json() + "\n"
+            finally:
+                for t in tasks:
+                    t.cancel()
+
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+    results = await asyncio.gather(*(run_item(i) for i in range(len(prepared))))
+    return AnalyzeDaysResponse(results=list(results))
+
+
+# --------- Day store routes ----------
+# DAY_STORE_DB 預設 day_store.db（第一次用到才開）；設成空字串就關掉這組 API
+day_store: Optional[DayStore] = None
+
+
+def get_day_store() -> DayStore:
+    global day_store
+    if day_store is None:
+        path = os.getenv("DAY_STORE_DB", "day_store.db")
+        if not path:
+            raise HTTPException(status_code=503, detail="day store disabled")
+        day_store = DayStore(path)
+    return day_store
+
+
+def stored_to_food_log(x: StoredLog) -> StoredFoodLog:
+    return StoredFoodLog(id=x.id, date=x.date, time=x.time, meal_type=x.meal_type, description=x.description)
+
+
+@app.get("/days/{user_id}/{date}/logs", response_model=DayLogsResponse)
+def list_day_logs(user_id: str, date: str):
+    logs = get_day_store().list(user_id, date)
+    return DayLogsResponse(user_id=user_id, date=date, logs=[stored_to_food_log(x) for x in logs])
+
+
+@app.post("/days/{user_id}/{date}/logs", response_model=StoredFoodLog)
+def append_day_log(user_id: str, date: str, log: FoodLog):
+    # 新增時就先跑詞庫比對，之後分析只要讀結果
+    stats = get_food_lexicon().analyze_meal(log.meal_type, log.description)
+    log_id = get_day_store().append(user_id, date, log.time, log.meal_type, log.description, stats)
+    return StoredFoodLog(id=log_id, date=date, time=log.time, meal_type=log.meal_type, description=log.description)
+
+
+@app.delete("/days/{user_id}/{date}/logs/{log_id}")
+def delete_day_log(user_id: str, date: str, log_id: int):
+    if not get_day_store().delete(user_id, date, log_id):
+        raise HTTPException(status_code=404, detail="log not found")
+    return {"ok": True}
+
+
+@app.post("/days/{user_id}/{date}/analyze", response_model=AnalyzeStoredDayResponse)
+async def analyze_stored_day(user_id: str, date: str, payload: AnalyzeStoredDayRequest):
+    # 這個 route 要等上游所以是 async，讀寫 SQLite 都丟到 thread，跟其他 day store route 一樣不卡 event loop
+    store = await asyncio.to_thread(get_day_store)
+    stored = await asyncio.to_thread(store.list, user_id, date)
+    if not stored:
+        resp = await complete_day(None)
+        return AnalyzeStoredDayResponse(**resp.model_dump(), mode="full")
+
+    ctx, profile = payload.context, payload.user_profile
+    logs = [stored_to_food_log(x) for x in stored]
+    stats = DayStats([x.stats for x in stored])
+    score = estimate_score(ctx.goal_type, logs, stats)
+    ids = [x.id for x in stored]
+    ckey = context_key(ctx.goal_type, profile)
+
+    prev = await asyncio.to_thread(store.get_analysis, user_id, date)
+    mode = "full"
+    if prev is not None and prev.context_key == ckey:
+        if prev.log_ids == ids:
+            RESPONSES.labels("days/analyze", "false").inc()
+            return AnalyzeStoredDayResponse(score=prev.score, analysis_text=prev.analysis_text, mode="unchanged")
+        if prev.log_ids and ids[:len(prev.log_ids)] == prev.log_ids:
+            mode = "delta"
+
+    if mode == "delta":
+        n = len(prev.log_ids)
+        prepared = PreparedDay(score, *build_delta_prompts(
+            ctx, profile, score, stats, prev.analysis_text, logs[n:], DayStats([x.stats for x in stored[n:]])
+        ))
+    else:
+        day = AnalyzeDayRequest(context=ctx, food_logs=logs, user_profile=profile)
+        prepared = PreparedDay(score, *build_prompts(day, score, stats))
+
+    resp = await complete_day(prepared)
+    RESPONSES.labels("days/analyze", str(resp.is_backup).lower()).inc()
+    if not resp.is_backup:
+        await asyncio.to_thread(
+            store.save_analysis, user_id, date, StoredAnalysis(ids, ckey, resp.score, resp.analysis_text)
         )
-        return AnalyzeDayResponse(score=score, analysis_text=backup, is_backup=True)
+    return AnalyzeStoredDayResponse(**resp.model_dump(), mode=mode)
@@ -0,0 +1,30 @@
+from main import AnalyzeDayRequest, request_cache_key
+
+
+def make_request(logs):
+    return AnalyzeDayRequest.model_validate({"context": {"goal_type": "maintenance"}, "food_logs": logs})
+
+
+def test_whitespace_does_not_change_key():
+    a = make_request([{"date": "2026-01-01", "meal_type": "早餐", "description": "茶葉蛋  無糖豆漿"}])
+    b = make_request([{"date": "2026-01-01", "meal_type": "早餐 ", "description": " 茶葉蛋 無糖豆漿"}])
+    assert request_cache_key(a) == request_cache_key(b)
+
+
+def test_dates_change_key():
+    # 同樣的描述，一天內吃完跟分成兩天吃，prompt 不一樣，不能共用 cache
+    one_day = make_request([
+        {"date": "2026-01-01", "meal_type": "早餐", "description": "茶葉蛋"},
+        {"date": "2026-01-01", "meal_type": "午餐", "description": "雞腿便當"},
+    ])
+    two_days = make_request([
+        {"date": "2026-01-01", "meal_type": "早餐", "description": "茶葉蛋"},
+        {"date": "2026-01-02", "meal_type": "午餐", "description": "雞腿便當"},
+    ])
+    assert request_cache_key(one_day) != request_cache_key(two_days)
+
+
+def test_time_changes_key():
+    a = make_request([{"date": "2026-01-01", "time": "08:00", "meal_type": "早餐", "description": "茶葉蛋"}])
+    b = make_request([{"date": "2026-01-01", "time": "10:30", "meal_type": "早餐", "description": "茶葉蛋"}])
+    assert request_cache_key(a) != request_cache_key(b)
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+import main
+from main import BreakerOpenError, CircuitBreaker
+
+
+def make_breaker(**kwargs) -> CircuitBreaker:
+    opts = dict(window=60.0, min_calls=3, error_rate=0.5, slow_call=1.0, slow_rate=0.5, open_for=60.0)
+    opts.update(kwargs)
+    return CircuitBreaker(**opts)
+
+
+def open_breaker(b: CircuitBreaker) -> None:
+    for _ in range(b.min_calls):
+        b.before_call()
+        b.record(False, 0.1)
+    assert b.state == CircuitBreaker.OPEN
+
+
+def test_opens_after_error_rate():
+    b = make_breaker()
+    b.before_call()
+    b.record(True, 0.1)
+    b.before_call()
+    b.record(False, 0.1)
+    assert b.state == CircuitBreaker.CLOSED  # 還沒到 min_calls
+    b.before_call()
+    b.record(False, 0.1)
+    assert b.state == CircuitBreaker.OPEN
+    with pytest.raises(BreakerOpenError):
+        b.before_call()
+    assert b.rejected == 1
+
+
+def test_opens_after_slow_rate():
+    b = make_breaker()
+    for _ in range(3):
+        b.before_call()
+        b.record(True, 2.0)
+    assert b.state == CircuitBreaker.OPEN
+
+
+def test_half_open_probe_success_closes():
+    b = make_breaker(open_for=0.0)
+    open_breaker(b)
+    b.before_call()
+    assert b.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(BreakerOpenError):
+        b.before_call()  # 同時只放一個探測
+    b.record(True, 0.1)
+    assert b.state == CircuitBreaker.CLOSED
+    b.before_call()
+
+
+@pytest.mark.parametrize("ok, latency", [(False, 0.1), (True, 2.0)])
+def test_half_open_probe_failure_reopens(ok, latency):
+    b = make_breaker(open_for=0.0)
+    open_breaker(b)
+    b.before_call()
+    b.record(ok, latency)
+    assert b.state == CircuitBreaker.OPEN
+    assert b.opened == 2
+
+
+def test_release_returns_probe_slot():
+    b = make_breaker(open_for=0.0)
+    open_breaker(b)
+    b.before_call()
+    b.release()  # 探測被取消
+    assert b.state == CircuitBreaker.HALF_OPEN
+    b.before_call()
+    b.record(True, 0.1)
+    assert b.state == CircuitBreaker.CLOSED
+
+
+class SlowStreamClient:
+    # 第一個 token 很快，但整段串流比 slow_call 久
+    def stream(self, system_prompt, user_prompt):
+        async def gen():
+            for i in range(5):
+                yield f"part{i}"
+                await asyncio.sleep(0.02)
+        return gen()
+
+
+def test_long_healthy_stream_is_not_slow(monkeypatch):
+    b = make_breaker(slow_call=0.05)
+    monkeypatch.setattr(main, "breaker", b)
+    monkeypatch.setattr(main, "get_llm_client", lambda: SlowStreamClient())
+
+    async def run():
+        return [d async for d in main.stream_openai("system", "user")]
+
+    for _ in range(5):
+        assert len(asyncio.run(run())) == 5
+    assert b.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_stream_releases_probe(monkeypatch):
+    b = make_breaker(open_for=0.0)
+    open_breaker(b)
+    monkeypatch.setattr(main, "breaker", b)
+    monkeypatch.setattr(main, "get_llm_client", lambda: SlowStreamClient())
+
+    async def run():
+        agen = main.stream_openai("system", "user")
+        await agen.__anext__()
+        await agen.aclose()  # client 斷線
+
+    asyncio.run(run())
+    assert b.state == CircuitBreaker.HALF_OPEN
+    b.before_call()
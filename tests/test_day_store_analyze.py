@@ -0,0 +1,93 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+USER, DATE = "u1", "2026-01-01"
+URL = f"/days/{USER}/{DATE}"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("DAY_STORE_DB", str(tmp_path / "day_store.db"))
+    monkeypatch.setattr(main, "day_store", None)
+    prompts = []
+
+    async def fake_call_openai(system_prompt, user_prompt):
+        prompts.append(user_prompt)
+        return f"analysis #{len(prompts)}"
+
+    monkeypatch.setattr(main, "call_openai", fake_call_openai)
+    c = TestClient(main.app)
+    c.prompts = prompts
+    yield c
+    main.day_store.close()
+
+
+def add_log(client, description, meal_type="早餐"):
+    r = client.post(f"{URL}/logs", json={"date": DATE, "meal_type": meal_type, "description": description})
+    assert r.status_code == 200
+    return r.json()["id"]
+
+
+def analyze(client, goal_type="maintenance"):
+    r = client.post(f"{URL}/analyze", json={"context": {"goal_type": goal_type}})
+    assert r.status_code == 200
+    return r.json()
+
+
+def test_full_then_unchanged(client):
+    add_log(client, "茶葉蛋＋無糖豆漿")
+    first = analyze(client)
+    assert first["mode"] == "full"
+    assert not first["is_backup"]
+
+    again = analyze(client)
+    assert again["mode"] == "unchanged"
+    assert again["analysis_text"] == first["analysis_text"]
+    assert len(client.prompts) == 1
+
+
+def test_appended_log_is_delta(client):
+    add_log(client, "茶葉蛋＋無糖豆漿")
+    analyze(client)
+    add_log(client, "雞胸肉便當加青菜", meal_type="午餐")
+
+    resp = analyze(client)
+    assert resp["mode"] == "delta"
+    assert "雞胸肉便當加青菜" in client.prompts[-1]
+    assert "茶葉蛋" not in client.prompts[-1]
+    assert analyze(client)["mode"] == "unchanged"
+
+
+def test_deleted_log_is_full(client):
+    first_id = add_log(client, "茶葉蛋＋無糖豆漿")
+    add_log(client, "雞胸肉便當加青菜", meal_type="午餐")
+    analyze(client)
+    assert client.delete(f"{URL}/logs/{first_id}").status_code == 200
+    assert analyze(client)["mode"] == "full"
+
+
+def test_changed_goal_is_full(client):
+    add_log(client, "茶葉蛋＋無糖豆漿")
+    analyze(client)
+    add_log(client, "雞胸肉便當加青菜", meal_type="午餐")
+    assert analyze(client, goal_type="fat_loss")["mode"] == "full"
+
+
+def test_backup_result_is_not_saved(client, monkeypatch):
+    async def failing_call_openai(system_prompt, user_prompt):
+        raise RuntimeError("upstream down")
+
+    add_log(client, "茶葉蛋＋無糖豆漿")
+    monkeypatch.setattr(main, "call_openai", failing_call_openai)
+    resp = analyze(client)
+    assert resp["is_backup"]
+    assert resp["mode"] == "full"
+    assert analyze(client)["mode"] == "full"
+
+
+def test_empty_day(client):
+    resp = analyze(client)
+    assert resp["mode"] == "full"
+    assert resp["is_backup"]
@@ -0,0 +1,111 @@
+import gc
+import time
+
+import pytest
+from pydantic import ValidationError
+
+from food_lexicon import FoodLexicon, FoodTerm, load_lexicon
+from main import FoodLog, estimate_score
+
+lexicon = load_lexicon()
+
+
+def score(goal_type: str, description: str) -> int:
+    logs = [FoodLog(date="2026-01-01", meal_type="晚餐", description=description)]
+    return estimate_score(goal_type, logs, lexicon.analyze_day(logs))
+
+
+# 期望值 = 舊版關鍵字估分的結果；含奶的手搖飲不能因為「鮮奶」「牛奶」被當成蛋白質而加分
+@pytest.mark.parametrize(
+    "description, goal_type, expected",
+    [
+        ("鮮奶茶", "maintenance", 50),
+        ("鮮奶茶", "fat_loss", 45),
+        ("珍珠鮮奶茶", "maintenance", 50),
+        ("半糖鮮奶茶", "maintenance", 50),
+        ("無糖鮮奶茶", "maintenance", 50),
+        ("牛奶茶", "maintenance", 60),
+        ("珍珠奶茶", "maintenance", 50),
+        ("全糖奶茶", "fat_loss", 45),
+        ("燙青菜", "maintenance", 70),
+        ("雞胸肉便當加青菜", "maintenance", 80),
+    ],
+)
+def test_score_matches_baseline(description, goal_type, expected):
+    assert score(goal_type, description) == expected
+
+
+# 舊版沒認出來的含糖飲料，現在要算 sugar（不能比什麼都沒吃到的 60 分高）
+@pytest.mark.parametrize("description", ["芋頭鮮奶", "珍珠鮮奶", "奶綠", "鮮奶綠"])
+def test_milk_drinks_count_as_sugar(description):
+    assert lexicon.analyze_meal("飲料", description).counts["sugar"] == 1
+    assert score("maintenance", description) == 50
+
+
+def test_leftmost_longest_without_overlap():
+    lex = FoodLexicon([FoodTerm("青菜", "vegetable", 50, 2), FoodTerm("菜", "vegetable", 30, 1)])
+    assert [m.food.term for m in lex.find("燙青菜")] == ["青菜"]
+
+
+def test_partially_overlapped_sugar_term_survives():
+    lex = FoodLexicon([FoodTerm("牛奶", "protein", 130, 7), FoodTerm("奶茶", "sugar", 350, 3)])
+    assert [m.food.term for m in lex.find("牛奶茶")] == ["牛奶", "奶茶"]
+
+
+def test_long_repeated_input_is_linear():
+    # 很長的「牛奶茶牛奶茶…」每一段都會走含糖詞的例外，不能變成平方時間
+    def best_of_5(n: int) -> float:
+        text = "牛奶茶" * n
+        times = []
+        for _ in range(5):
+            t0 = time.perf_counter()
+            lexicon.find(text)
+            times.append(time.perf_counter() - t0)
+        return min(times)
+
+    gc.disable()
+    try:
+        small, large = best_of_5(1000), best_of_5(8000)
+    finally:
+        gc.enable()
+    assert large < small * 32  # 線性約 8 倍，平方會是 64 倍
+
+
+def test_description_length_is_capped():
+    with pytest.raises(ValidationError):
+        FoodLog(date="2026-01-01", meal_type="晚餐", description="牛奶茶" * 1000)
+
+
+def day_score(goal_type: str, descriptions) -> int:
+    logs = [FoodLog(date="2026-01-01", meal_type="正餐", description=d) for d in descriptions]
+    return estimate_score(goal_type, logs, lexicon.analyze_day(logs))
+
+
+def test_staple_protein_does_not_count_as_protein():
+    # 白飯＋麵＋吐司加起來蛋白質超過 15 g，但沒有蛋白質來源，跟舊版一樣 60
+    assert day_score("maintenance", ["白飯", "麵", "吐司"]) == 60
+    assert day_score("muscle_gain", ["白飯", "麵", "吐司"]) == 60
+
+
+def test_fried_protein_counts_per_meal():
+    # 雞排：fried（-5）但蛋白質夠（+10）
+    assert day_score("maintenance", ["雞排"]) == 65
+    # 薯條 4 g 一餐一份，分三餐也不能湊成蛋白質
+    assert day_score("maintenance", ["薯條", "薯條", "薯條", "薯條"]) == 55
+
+
+# 英文詞要整個字才算
+@pytest.mark.parametrize(
+    "description, counts",
+    [
+        ("veggie wrap", {"vegetable": 1}),
+        ("price of coffee", {}),
+        ("pancake", {}),
+        ("eggplant", {"vegetable": 1}),
+        ("2 eggs and rice", {"protein": 1, "staple": 1}),
+        ("chocolate cookies", {"sugar": 2}),
+        ("雞胸肉salad", {"protein": 1, "vegetable": 1}),
+    ],
+)
+def test_english_terms_match_whole_words(description, counts):
+    assert dict(lexicon.analyze_meal("午餐", description).counts) == counts
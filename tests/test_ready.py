@@ -0,0 +1,36 @@
+import time
+import asyncio
+
+from fastapi.testclient import TestClient
+
+import main
+
+
+def test_ready_after_warm_up():
+    with TestClient(main.app) as client:
+        r = client.get("/ready")
+        assert r.status_code == 200
+        assert r.json() == {"ready": True}
+
+
+def test_not_ready_when_warm_up_fails(monkeypatch):
+    monkeypatch.setenv("FOOD_LEXICON_PATH", "/nonexistent.json")
+    monkeypatch.setattr(main, "food_lexicon", None)
+    with TestClient(main.app) as client:
+        r = client.get("/ready")
+        assert r.status_code == 503
+        assert r.json()["ready"] is False
+        assert "FileNotFoundError" in r.json()["error"]
+
+
+def test_slow_upstream_prewarm_does_not_block_startup(monkeypatch):
+    async def hang(self):
+        await asyncio.sleep(30)
+
+    monkeypatch.setenv("OPENAI_API_KEY", "fake")
+    monkeypatch.setattr(main.LLMClient, "warm_up", hang)
+    t0 = time.perf_counter()
+    with TestClient(main.app) as client:
+        assert client.get("/ready").status_code == 200
+        assert client.get("/health").status_code == 200
+    assert time.perf_counter() - t0 < 5